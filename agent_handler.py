@@ -1,148 +1,162 @@
 import os
-from openai import OpenAI
-import asyncio
-from agents import Agent, Runner, function_tool
+import time
+import inspect
+import threading
+from datetime import datetime
 from dotenv import load_dotenv
-import sqlite3
-import json
-from PIL import Image
-import io
-import requests
-from bs4 import BeautifulSoup
-import re
-import streamlit as st
-import openai
+import traceback
+from jobs import submit_refresh, get_job, start_worker
+from intent_router import ROUTER_ENABLED, match_intent, observe_planner_call, record_routed
+from db import best_craft_by_tokens, best_craft
+from function_handler import add_chat_message
+from connections import get_connection
+from async_runtime import openai_client
+from tracing import span, traced
+import tracing
+from llm_cache import completion_key
+from outreach import MESSAGE_MODEL, MESSAGE_TEMPERATURE, get_completion_cache, product_fields, pitch_prompt
 
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# point every OpenAI call at another server, e.g. mock_openai_server.py
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+# "responses" or "chat_completions"; stand-in servers usually speak only chat completions
+AGENT_OPENAI_API = os.getenv("AGENT_OPENAI_API", "chat_completions" if OPENAI_BASE_URL else "responses")
 
+_agent = None
+_agent_lock = threading.Lock()
 
-@function_tool
-def search_client():
+
+class ModelCallRecorder:
+    """
+    Times the SDK's model-call spans (the agent's planning turns) for
+    intent_router's savings estimate and copies them into our trace file while
+    tracing is on. The SDK only emits them when its own tracing is enabled
+    (OPENAI_AGENTS_DISABLE_TRACING unset). Implements the SDK's
+    TracingProcessor interface without subclassing it, so defining it does not
+    import the SDK.
+    """
+
+    def on_trace_start(self, trace):
+        pass
+
+    def on_trace_end(self, trace):
+        pass
+
+    def on_span_start(self, span):
+        pass
+
+    def on_span_end(self, span):
+        data = span.span_data
+        if data.type == "generation":
+            model, usage = data.model, data.usage or {}
+            input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        elif data.type == "response" and data.response is not None:
+            model, usage = data.response.model, data.response.usage
+            input_tokens, output_tokens = (usage.input_tokens, usage.output_tokens) if usage else (0, 0)
+        else:
+            return
+        started, ended = datetime.fromisoformat(span.started_at), datetime.fromisoformat(span.ended_at)
+        observe_planner_call((ended - started).total_seconds())
+        if not tracing.enabled:
+            return
+        tracing.record("openai", f"agent.{data.type}", (ended - started).total_seconds() * 1000,
+                       start=started.timestamp(), error=span.error["message"] if span.error else None,
+                       model=model, input_tokens=input_tokens, output_tokens=output_tokens,
+                       cost_usd=tracing.cost(model, input_tokens, output_tokens))
+
+    def shutdown(self):
+        pass
+
+    def force_flush(self):
+        pass
+
+
+
+async def cached_completion(prompt: str, bypass_cache: bool = False) -> str:
+    """
+    gpt-4o reply to `prompt`, served from the completion cache when the same
+    (model, prompt, temperature) was answered before. bypass_cache skips the
+    lookup but still stores the fresh reply.
+    """
+    key = completion_key(MESSAGE_MODEL, prompt, MESSAGE_TEMPERATURE)
+    if not bypass_cache:
+        cached = get_completion_cache().get(key)
+        if cached is not None:
+            return cached
+    with span("openai", "chat.completions") as call:
+        response = await openai_client().chat.completions.create(
+            model=MESSAGE_MODEL,
+            temperature=MESSAGE_TEMPERATURE,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        call.usage(response)
+    message = response.choices[0].message.content.strip()
+    get_completion_cache().put(key, message)
+    return message
+
+
+@traced("tool")
+def search_client(full_refresh: bool = False, fuzzy_match: bool = False):
     """
     Uses the crafts database to extract trigger keywords (from metadata and images),
     searches for potential clients from the client database using those triggers,
     and stores matching clients in potential_clients.db.
     Missing fields like email are filled as 'NA'. Reason explains why the client matched.
-    """
-    try:
-        print("Connecting to images.db...")
-        conn_crafts = sqlite3.connect("images.db", check_same_thread=False)
-        cursor_crafts = conn_crafts.cursor()
-        cursor_crafts.execute("SELECT metadata, image FROM images")
-        rows = cursor_crafts.fetchall()
-        conn_crafts.close()
-        print(f"Loaded {len(rows)} image rows.")
-
-        triggers = set()
-
-        for metadata_str, image_blob in rows:
-            try:
-                metadata = json.loads(metadata_str)
-            except json.JSONDecodeError:
-                print("Invalid JSON in metadata.")
-                continue
-
-            for key in ['type', 'style', 'color', 'material', 'estimated_size', 'handcrafted']:
-                value = metadata.get(key)
-                if value:
-                    if isinstance(value, list):
-                        triggers.update(value)
-                    else:
-                        triggers.add(str(value))
-
-            if image_blob:
-                try:
-                    image = Image.open(io.BytesIO(image_blob)).convert("RGB")
-                    colors = image.getcolors(maxcolors=1000000)
-                    if colors:
-                        dominant_color = max(colors, key=lambda item: item[0])[1]
-                        color_str = f"rgb{dominant_color}"
-                        triggers.add(color_str)
-                except Exception as img_err:
-                    print(f"Image error: {img_err}")
-                    continue
-
-        print("Extracted triggers:", triggers)
-
-        print("Connecting to meesho.db...")
-        conn_clients = sqlite3.connect("meesho.db", check_same_thread=False)
-        cursor_clients = conn_clients.cursor()
-        cursor_clients.execute("SELECT id, name, address, last_bought_item, liked_products, email, phone FROM customers")
-        all_clients = cursor_clients.fetchall()
-        conn_clients.close()
-        print(f"Loaded {len(all_clients)} clients.")
-
-        matched_clients = []
-
-        for row in all_clients:
-            id_, name, address, last_bought, liked, email, phone = row
-            text_blob = f"{(last_bought or '')} {(liked or '')} {(address or '')}".lower()
-            matched_triggers = [t for t in triggers if t.lower() in text_blob]
-            if matched_triggers:
-                reason_prompt = f"""
-                You are an expert product marketer.
-
-                Craft Product Triggers: {', '.join(matched_triggers)}
-                Client Details:
-                    - Name: {name}
-                    - Last Bought: {last_bought}
-                    - Liked Products: {liked}
-                    - Address: {address}
-
-                Write a short professional summary explaining why this client is a good match for the crafts.
-                """
-
-                reason = client.chat.completions.create(
-                    model="gpt-4o",  
-                    messages=[{"role": "user", "content": reason_prompt}]
-                ).choices[0].message.content.strip()
-
-                matched_clients.append((name, email if email else "NA", reason))
-
-
-        print(f"{len(matched_clients)} clients matched.")
-
-        print("Saving to potential_clients.db...")
-        conn_out = sqlite3.connect("potential_clients.db", check_same_thread=False)
-        cursor_out = conn_out.cursor()
-        cursor_out.execute("""
-            CREATE TABLE IF NOT EXISTS clients (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT,
-                email TEXT,
-                reason TEXT
-            )
-        """)
-        if matched_clients:
-            cursor_out.executemany("INSERT INTO clients (name, email, reason) VALUES (?, ?, ?)", matched_clients)
-            conn_out.commit()
-        conn_out.close()
-        print("Data saved successfully.")
 
-        if not matched_clients:
-            return "No potential clients matched current craft triggers."
+    Only crafts and clients added since the last refresh are processed and existing
+    clients are updated in place. Set full_refresh to rescan everything.
+    Set fuzzy_match to match on text similarity (e.g. "wooden" vs "wood") instead of exact triggers.
 
-        return [f"{name} ({email}) - {reason}" for name, email, reason in matched_clients]
+    The search runs in the background: this returns a job id straight away.
+    Use search_job_status with that id to see its progress and results.
+    """
+    try:
+        start_worker()
+        job_id = submit_refresh(full_refresh, "tfidf" if fuzzy_match else None)
+        return f"Client search queued as job #{job_id}. Progress is shown in the Craftsman tab."
 
     except Exception as e:
         return f"Error accessing databases: {e}\nTrace:\n{traceback.format_exc()}"
 
 
-@function_tool
-def message_framer(name: str, followup_query: str = "") -> str:
+@traced("tool")
+def search_job_status(job_id: int):
+    """
+    Status of a background client search started by search_client: queued, running
+    (with customers scanned and matches so far), done (with the matched clients),
+    failed or cancelled.
+    """
+    job = get_job(job_id)
+    if job is None:
+        return f"No search job #{job_id}."
+    progress = job["progress"] or {}
+    if job["status"] in ("queued", "cancelled"):
+        return f"Search job #{job_id} is {job['status']}."
+    if job["status"] == "running":
+        return (f"Search job #{job_id} is running: {progress.get('customers_scanned', 0)}/"
+                f"{progress.get('customers_total', 0)} customers scanned, {progress.get('candidates', 0)} matches, "
+                f"{progress.get('clients_upserted', 0)} clients saved.")
+    if job["status"] == "failed":
+        return f"Search job #{job_id} failed: {job['error']}"
+    result = job["result"]
+    if not result["clients"]:
+        return "No new potential clients matched current craft triggers."
+    return [f"{result['clients']} potential clients found:"] + result["preview"]
+
+
+@traced("tool")
+async def message_framer(name: str, followup_query: str = "", bypass_cache: bool = False) -> str:
     """
     Frames a personalized pitch message or follow-up reply using client and craft info.
-    Uses LLM to generate messages.
+    Uses LLM to generate messages; identical prompts are answered from the completion cache.
+    Set bypass_cache to force a freshly generated message.
     Also stores follow-up queries in chat_history.db as user messages.
     """
     try:
-        conn_client = sqlite3.connect("potential_clients.db")
-        cursor_client = conn_client.cursor()
-        cursor_client.execute("SELECT email, reason FROM clients WHERE name = ?", (name,))
-        result = cursor_client.fetchone()
-        conn_client.close()
+        result = get_connection("potential_clients").execute(
+            "SELECT email, reason FROM clients WHERE name = ?", (name,)
+        ).fetchone()
         if not result:
             return f"No data found for {name} in potential clients database."
         email, reason = result
@@ -150,148 +164,49 @@ def message_framer(name: str, followup_query: str = "") -> str:
         return f"Failed to fetch client data for {name}: {e}"
 
     try:
-        conn_craft = sqlite3.connect("images.db")
-        cursor_craft = conn_craft.cursor()
-        cursor_craft.execute("SELECT image, metadata FROM images")
-        crafts = cursor_craft.fetchall()
-        conn_craft.close()
+        best_match = best_craft(reason)
     except Exception as e:
         return f"Failed to load crafts info: {e}"
 
-    if not crafts:
+    if not best_match:
         return f"No crafts found to reference."
-    
-    reason_lower = reason.lower()
-    best_match = None
-    best_score = 0
-
-    for image_blob, metadata_json in crafts:
-        try:
-            if metadata_json is None or metadata_json == "":
-                metadata = {}
-            else:
-                metadata = json.loads(metadata_json)
-                
-            if not isinstance(metadata, dict):
-                metadata = {}
-                
-        except (json.JSONDecodeError, TypeError) as e:
-            metadata = {}
-        
-        fields = [
-            str(metadata.get("type", "")),
-            str(metadata.get("style", "")),
-            str(metadata.get("color", "")),
-            str(metadata.get("material", "")),
-            str(metadata.get("estimated_size", "")),
-            str(metadata.get("handcrafted", ""))
-        ]
-        
-        match_score = sum(1 for field in fields if field.lower() and field.lower() in reason_lower)
-        if match_score > best_score:
-            best_score = match_score
-            best_match = (image_blob, metadata)
 
-    if not best_match:
-        try:
-            image_blob, metadata_json = crafts[0]
-            if metadata_json is None or metadata_json == "":
-                metadata = {}
-            else:
-                metadata = json.loads(metadata_json)
-                if not isinstance(metadata, dict):
-                    metadata = {}
-        except (json.JSONDecodeError, TypeError):
-            metadata = {}
-        best_match = (image_blob, metadata)
-    
-    image_blob, metadata = best_match
-
-    style = metadata.get("style", "unique")
-    material = metadata.get("material", "premium material")
-    estimated_size = metadata.get("estimated_size", "standard size")
-    handcrafted = metadata.get("handcrafted", "yes")
-    color = metadata.get("color", "classic tone")
-
-    product_details = f"""
-    Client Name: {name}
-    Product Details:
-        - Material: {material}
-        - Style: {style}
-        - Color: {color}
-        - Size: {estimated_size}
-        - Handcrafted: {handcrafted}
-    Reason for Interest: {reason}
-    """
+    _, metadata = best_match
+    fields = product_fields(metadata)
 
     if not followup_query.strip():
         # --- Generate First Pitch Message ---
-        prompt = f"""
-        You are a creative marketing assistant.
-
-        Using the following client and product details,type write a short(2-3 lines), friendly, and attractive message that encourages the client to explore the product:
-
-        {product_details}
-
-        Keep it professional yet warm.
-        After warm ragards add from crafts team only.
-        """
+        prompt = pitch_prompt(name, reason, metadata)
     else:
         # --- Store follow-up query in chat_history.db ---
         try:
-            table_name = f"chat_{name.lower().replace(' ', '_')}"
-
-            conn_chat = sqlite3.connect("chat_history.db")
-            cursor_chat = conn_chat.cursor()
-
-            cursor_chat.execute(f"""
-            CREATE TABLE IF NOT EXISTS {table_name} (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sender TEXT,
-                message TEXT,
-                image BLOB
-                )
-            """)
-
-            cursor_chat.execute(f"""
-                INSERT INTO {table_name} (sender, message, image)
-                VALUES (?, ?, ?)
-                """, ('user', followup_query, None))
-            conn_chat.commit()
-
-            conn_chat.close()
-
+            add_chat_message(name, 'user', followup_query)
         except Exception as e:
             return f"Failed to store query in chat_history.db: {e}"
 
 
         # --- Generate Follow-up Reply ---
-        prompt = prompt = f"""
+        prompt = f"""
         You are a product assistant.
 
         A client named {name} has asked: "{followup_query}"
 
         Using ONLY the following product details,type answer clearly and directly in 2-3 lines:
-        - Material: {material}
-        - Style: {style}
-        - Color: {color}
-        - Size: {estimated_size}
-        - Handcrafted: {handcrafted}
+        - Material: {fields['material']}
+        - Style: {fields['style']}
+        - Color: {fields['color']}
+        - Size: {fields['estimated_size']}
+        - Handcrafted: {fields['handcrafted']}
 
         Focus strictly on answering the query using these details. Avoid any extra commentary. Do not add greetings or conclusions.
         """
 
     try:
-        message = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}]
-        ).choices[0].message.content.strip()
-        
-        return message
+        return await cached_completion(prompt, bypass_cache)
     except Exception as e:
         return f"Failed to generate message: {e}"
     
-@function_tool
+@traced("tool")
 def image_sender_tool(name: str, agent_message: str) -> str:
     """
     Picks the best-matching image based on the agent's message,
@@ -306,64 +221,14 @@ def image_sender_tool(name: str, agent_message: str) -> str:
     Returns:
         str: Confirmation message or 'NULL' if no match found.
     """
-    table_name = f"chat_{name.lower().replace(' ', '_')}"
-
     try:
-        conn_chat = sqlite3.connect("chat_history.db")
-        cursor_chat = conn_chat.cursor()
-
-        cursor_chat.execute(f"""
-            CREATE TABLE IF NOT EXISTS {table_name} (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                sender TEXT,
-                message TEXT,
-                image BLOB
-            )
-        """)
-
         tokens = set(word.lower() for word in agent_message.split())
 
-        conn_craft = sqlite3.connect("images.db")
-        cursor_craft = conn_craft.cursor()
-        cursor_craft.execute("SELECT image, metadata FROM images")
-        crafts = cursor_craft.fetchall()
-        conn_craft.close()
-
-        best_match = None
-        best_score = 0
-
-        for image_blob, metadata_json in crafts:
-            try:
-                metadata = json.loads(metadata_json) if metadata_json else {}
-            except json.JSONDecodeError:
-                metadata = {}
-
-            fields = [
-                str(metadata.get("type", "")),
-                str(metadata.get("style", "")),
-                str(metadata.get("color", "")),
-                str(metadata.get("material", "")),
-                str(metadata.get("estimated_size", "")),
-                str(metadata.get("handcrafted", ""))
-            ]
-            field_tokens = set(word.lower() for field in fields for word in field.split())
-
-            match_score = len(tokens.intersection(field_tokens))
-
-            if match_score > best_score:
-                best_score = match_score
-                best_match = image_blob
-
-        if not best_match:
+        image_id = best_craft_by_tokens(tokens)
+        if image_id is None:
             return "NULL"
 
-        cursor_chat.execute(f"""
-            INSERT INTO {table_name} (sender, message, image)
-            VALUES (?, ?, ?)
-        """, ('agent', None, best_match))
-
-        conn_chat.commit()
-        conn_chat.close()
+        add_chat_message(name, 'agent', None, image_ref=image_id)
 
         return f"Image sent based on agent's message and stored for {name}."
 
@@ -371,7 +236,7 @@ def image_sender_tool(name: str, agent_message: str) -> str:
         return f"Error in image_sender_tool: {e}"
 
 
-@function_tool
+@traced("tool")
 def sender_tool(name: str, message: str) -> str:
     """
     Receives a message from the agent, stores it in the chat log,
@@ -384,36 +249,14 @@ def sender_tool(name: str, message: str) -> str:
     if not message:
         return "No agent message provided."
 
-    table_name = f"chat_{name.lower().replace(' ', '_')}"
-
-    conn = sqlite3.connect("chat_history.db")
-    cursor = conn.cursor()
-
-    cursor.execute(f"""
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            sender TEXT,
-            message TEXT,
-            image BLOB
-        )
-    """)
-
-    cursor.execute(f"""
-        INSERT INTO {table_name} (sender, message ,image)
-        VALUES (?, ? ,?)
-    """, ("agent", message , None))
-
-    conn.commit()
-    conn.close()
+    add_chat_message(name, "agent", message)
 
     print(f"\nAgent to {name}: {message}\n")
 
     return "Agent message sent to user and stored."
 
 
-agent = Agent(
-    name="CraftSalesAssistant",
-    instructions="""
+AGENT_INSTRUCTIONS = """
 You are CraftSalesAssistant — a smart and proactive AI agent designed to help discover potential buyers for handmade crafts,
 send personalized pitch messages, and handle interactive follow-up queries.
 You operate using four specialized tools to build relationships and drive sales.
@@ -422,6 +265,8 @@ Think about what each client needs in their specific situation.
 When someone asks you to refresh the database or search clients, use search_client to find new prospects.
 This tool searches potential clients for our products and stores them into the database. 
 If there’s any query related to this, you should call this tool.
+The search runs in the background and returns a job id; tell the user it has started, and use search_job_status
+with that id when they ask how it is going or what it found.
 
 When sending initial messages, use message_framer with followup_query set to null, then deliver it with sender_tool. 
 
@@ -438,26 +283,201 @@ After completing any task, provide a clear confirmation message showing successf
 Your goal is to understand each client's needs and respond in the most helpful way possible.
 
 
-""",
-    tools=[search_client, message_framer, sender_tool ,image_sender_tool],
-    model="gpt-4o"
-)
+"""
+TOOLS = [search_client, search_job_status, message_framer, sender_tool, image_sender_tool]
+
+
+def get_agent():
+    """
+    CraftSalesAssistant, built on first use. The agents SDK takes about a
+    second to import, so it is only loaded (and pointed at the shared client)
+    when the first request actually needs the agent.
+    """
+    global _agent
+    with _agent_lock:
+        if _agent is None:
+            from agents import Agent, add_trace_processor, function_tool, set_default_openai_api, set_default_openai_client
+
+            #the agent and message_framer share one pooled client; both run on async_runtime's loop
+            set_default_openai_client(openai_client())
+            set_default_openai_api(AGENT_OPENAI_API)
+            add_trace_processor(ModelCallRecorder())
+            _agent = Agent(
+                name="CraftSalesAssistant",
+                instructions=AGENT_INSTRUCTIONS,
+                tools=[function_tool(tool) for tool in TOOLS],
+                model="gpt-4o"
+            )
+        return _agent
+
+#message_framer reports failures as text; these must not be sent to the client
+FRAMER_ERRORS = ("No data found", "Failed to", "No crafts found", "An error occurred")
+
+
+async def _tool_events(tool, outputs, **arguments):
+    """Calls a tool function as the agent would, yielding its tool_start/tool_end events; the output goes to `outputs`."""
+    yield {"type": "tool_start", "name": tool.__name__}
+    try:
+        output = tool(**arguments)
+        if inspect.isawaitable(output):
+            output = await output
+        output = str(output)
+    except Exception as e:
+        # the SDK hands a failing tool's error back as text, too
+        output = f"An error occurred while running the tool. Error: {e}"
+    outputs.append(output)
+    yield {"type": "tool_end", "name": tool.__name__, "output": output}
 
 
+async def run_intent(intent):
+    """
+    Runs a request matched by intent_router with the tools the agent would
+    pick, without asking the model, and streams the same events as
+    ask_agent_streaming plus
+      {"type": "routed", "intent": str, "saved_calls": int, "saved_seconds": float}
+    just before the final response.
+    """
+    started = time.perf_counter()
+    kind = intent["intent"]
+    outputs = []
+    with span("agent", "route", intent=kind) as route:
+        if kind == "refresh":
+            stages = 1
+            async for event in _tool_events(search_client, outputs, full_refresh=intent["full_refresh"],
+                                            fuzzy_match=intent["fuzzy_match"]):
+                yield event
+            reply = outputs[-1]
+
+        elif kind == "pitch":
+            stages = 2
+            sent, failed = [], []
+            for name in intent["names"]:
+                async for event in _tool_events(message_framer, outputs, name=name):
+                    yield event
+                message = outputs[-1]
+                if message.startswith(FRAMER_ERRORS):
+                    failed.append(f"{name}: {message}")
+                    continue
+                async for event in _tool_events(sender_tool, outputs, name=name, message=message):
+                    yield event
+                sent.append(name)
+            reply = "\n".join(([f"Pitch sent to {', '.join(sent)}."] if sent else []) + failed)
+
+        elif kind == "image":
+            name, agent_message = intent["name"], intent["subject"]
+            stages = 1 if agent_message else 2
+            if not agent_message:
+                # no subject given: show the craft the pitch would be about
+                async for event in _tool_events(message_framer, outputs, name=name):
+                    yield event
+                agent_message = outputs[-1]
+            if agent_message.startswith(FRAMER_ERRORS):
+                reply = agent_message
+            else:
+                async for event in _tool_events(image_sender_tool, outputs, name=name, agent_message=agent_message):
+                    yield event
+                reply = f"No matching craft image found for {name}." if outputs[-1] == "NULL" else f"Image sent to {name}."
+
+        else:
+            name = intent["name"]
+            stages = 2
+            async for event in _tool_events(message_framer, outputs, name=name, followup_query=intent["reply"]):
+                yield event
+            message = outputs[-1]
+            if message.startswith(FRAMER_ERRORS):
+                reply = message
+            else:
+                if intent["wants_image"]:
+                    async for event in _tool_events(image_sender_tool, outputs, name=name, agent_message=message):
+                        yield event
+                async for event in _tool_events(sender_tool, outputs, name=name, message=message):
+                    yield event
+                reply = f"Replied to {name}: {message}"
+
+        saved_calls, saved_seconds = record_routed(stages)
+        route.set(saved_calls=saved_calls, saved_seconds=round(saved_seconds, 3))
+    print(f"Routed '{kind}' in {(time.perf_counter() - started) * 1000:.0f} ms, "
+          f"saved {saved_calls} LLM calls (~{saved_seconds:.1f} s)")
+    yield {"type": "routed", "intent": kind, "saved_calls": saved_calls, "saved_seconds": saved_seconds}
+    yield {"type": "final_response", "content": reply}
+
+
+@traced("agent")
 async def ask_agent(prompt: str) -> str:
-    result = await Runner.run(agent, prompt)
+    intent = match_intent(prompt) if ROUTER_ENABLED else None
+    if intent is not None:
+        async for event in run_intent(intent):
+            if event["type"] == "final_response":
+                return event["content"]
+    from agents import Runner
+
+    result = await Runner.run(get_agent(), prompt)
     return result.final_output.strip() if result.final_output else "No response generated."
 
 async def ask_agent_streaming(prompt: str):
-    """Stream only function/tool call events from Runner."""
-    try:
-        result = Runner.run_streamed(agent, input=prompt)
-        async for event in result.stream_events():
-            if hasattr(event, 'type') and event.type == "run_item_stream_event":
-                if hasattr(event, 'item') and hasattr(event.item, 'type') and event.item.type == "tool_call_item":
-                    yield event  
+    """
+    Streams a run as plain dict events:
+      {"type": "response_start"}                     a new model response begins
+      {"type": "text_delta", "content": str}         output text as it is generated
+      {"type": "tool_start", "name": str}            a tool call was issued
+      {"type": "tool_end", "name": str, "output": str}
+      {"type": "final_response", "content": str}     the run's final output, always last
+    Time to first token and total run time are logged for each request.
+    Structured requests (see intent_router) skip the agent and stream run_intent's events instead.
+    """
+    intent = match_intent(prompt) if ROUTER_ENABLED else None
+    if intent is not None:
+        async for event in run_intent(intent):
+            yield event
+        return
+
+    from agents import Runner
+
+    started = time.perf_counter()
+    first_token = None
+    tool_names = {}
+    yielded = False
+    with span("agent", "ask_agent_streaming") as run:
+        try:
+            result = Runner.run_streamed(get_agent(), input=prompt)
+            async for event in result.stream_events():
+                if event.type == "raw_response_event":
+                    data_type = getattr(event.data, "type", "")
+                    if data_type == "response.created":
+                        yielded = True
+                        yield {"type": "response_start"}
+                    elif data_type == "response.output_text.delta" and event.data.delta:
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                            print(f"Agent TTFT: {first_token * 1000:.0f} ms")
+                        yielded = True
+                        yield {"type": "text_delta", "content": event.data.delta}
+
+                elif event.type == "run_item_stream_event":
+                    if event.item.type == "tool_call_item":
+                        raw_item = event.item.raw_item
+                        name = getattr(raw_item, "name", "tool")
+                        tool_names[getattr(raw_item, "call_id", None)] = name
+                        yielded = True
+                        yield {"type": "tool_start", "name": name}
+                    elif event.item.type == "tool_call_output_item":
+                        raw_item = event.item.raw_item
+                        call_id = raw_item.get("call_id") if isinstance(raw_item, dict) else getattr(raw_item, "call_id", None)
+                        yielded = True
+                        yield {"type": "tool_end", "name": tool_names.get(call_id, "tool"), "output": str(event.item.output)}
+
+            final_output = str(result.final_output or "").strip()
+            yield {"type": "final_response", "content": final_output or "No response generated."}
 
-    except Exception as e:
-        st.error(f"Streaming error: {e}")
-        result = await Runner.run(agent, prompt)
-        yield {"type": "final_response", "content": result.final_output.strip()}
+        except Exception as e:
+            print(f"Streaming error: {e}")
+            if yielded:
+                # tools may already have run; re-running the whole prompt would repeat them
+                yield {"type": "final_response", "content": f"Streaming error: {e}"}
+            else:
+                result = await Runner.run(get_agent(), prompt)
+                yield {"type": "final_response", "content": (result.final_output or "").strip()}
+        finally:
+            ttft = f"{first_token * 1000:.0f} ms" if first_token is not None else "n/a"
+            print(f"Agent run finished in {(time.perf_counter() - started) * 1000:.0f} ms (TTFT {ttft})")
+            run.set(ttft_ms=round(first_token * 1000, 1) if first_token is not None else None)
@@ -5,11 +5,13 @@ from dotenv import load_dotenv
 ENV_FILE = '.env'
 load_dotenv(ENV_FILE)
 
-import sqlite3
-import asyncio
-import openai
-from db import init_db, save_image_with_metadata, get_images_with_metadata
-from function_handler import fetch_chat_history, fetch_clients, fetch_messaged_clients, mark_client_messaged, chat_history_user, reset_chat_history_preserve_first , load_api_key_from_env ,save_api_key_to_env
+import tracing
+from async_runtime import run, iterate, openai_client
+from db import init_db, count_images, get_gallery_page
+from client_search import init_potential_clients_db
+from jobs import init_jobs_db, start_worker, submit_refresh, recent_jobs, cancel_job
+from intent_router import router_stats
+from function_handler import init_chat_db, fetch_chat_page, fetch_chat_image, chat_client_id, DUMMY_CLIENT_ID, fetch_clients, fetch_messaged_clients, reset_chat_history_preserve_first , load_api_key_from_env ,save_api_key_to_env
 
 api_key = load_api_key_from_env()
 
@@ -26,48 +28,220 @@ if not api_key:
     st.stop()
 
 try:
-    from llm_parser import extract_metadata_from_image
+    from ingest import ingest_images
     from agent_handler import ask_agent_streaming 
+    from outreach import send_pitches
 except Exception as e:
     st.error(f"Error importing modules: {str(e)}")
     st.error("Please refresh the page after setting your API key.")
     st.stop()
 
-async def stream_agent(user_query, status_placeholder=None):
+AGENT_TIMEOUT = float(os.getenv("AGENT_TIMEOUT", "180"))
+
+
+def stream_agent(user_query, status_placeholder=None, response_placeholder=None):
+    """Runs the agent on the shared event loop (async_runtime) and renders its events from this script run."""
     final_response = ""
+    streamed_text = ""
+    routed = None
+
+    try:
+        for event in iterate(ask_agent_streaming(user_query), timeout=AGENT_TIMEOUT):
+            if event["type"] == "response_start":
+                streamed_text = ""
+
+            elif event["type"] == "text_delta":
+                streamed_text += event["content"]
+                if response_placeholder:
+                    response_placeholder.markdown(streamed_text + "▌")
+
+            elif event["type"] in ("tool_start", "tool_end") and status_placeholder:
+                tool_name = event["name"].replace("_", " ").title()
+                label = "Calling tool" if event["type"] == "tool_start" else "Finished tool"
+                status_placeholder.markdown(
+                    f"🔧 <b>{label}:</b> {tool_name}",
+                    unsafe_allow_html=True
+                )
 
-    async for event in ask_agent_streaming(user_query):
-        if hasattr(event, 'type') and event.type == "run_item_stream_event":
-            if hasattr(event, 'item') and hasattr(event.item, 'type') and event.item.type == "tool_call_item":
-                tool_name = event.item.raw_item.name.replace("_", " ").title()
-                if status_placeholder:
-                    status_placeholder.markdown(
-                        f"🔧 <b>Calling tool:</b> {tool_name}",
-                        unsafe_allow_html=True
-                    )
+            elif event["type"] == "routed":
+                routed = event
 
-        elif hasattr(event, 'type') and event.type == "final_response":
-            final_response = getattr(event, 'content', "")
+            elif event["type"] == "final_response":
+                final_response = event["content"]
+    except TimeoutError:
+        final_response = f"The agent did not finish within {AGENT_TIMEOUT:.0f}s; its run was cancelled."
+        st.error(final_response)
 
+    if response_placeholder:
+        response_placeholder.markdown(final_response)
+    if routed:
+        st.caption(f"⚡ Handled without the planner: {routed['saved_calls']} LLM calls "
+                   f"(~{routed['saved_seconds']:.1f}s) saved")
     return final_response
 
 
-def safe_async_run(coro):
-    try:
-        loop = asyncio.get_event_loop()
-    except RuntimeError:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-    if loop.is_running():
-        return asyncio.ensure_future(coro)
-    else:
-        return loop.run_until_complete(coro)
+GALLERY_COLUMNS = 6
+GALLERY_PAGE_SIZE = int(os.getenv("GALLERY_PAGE_SIZE", "24"))
 
 
-init_db()
+@st.fragment
+def show_gallery():
+    total = count_images()
+    if not total:
+        st.info("No images uploaded yet.")
+        return
+    pages = (total + GALLERY_PAGE_SIZE - 1) // GALLERY_PAGE_SIZE
+    page = min(st.session_state.get("gallery_page", 0), pages - 1)
+
+    columns = st.columns(GALLERY_COLUMNS)
+    for i, (image_id, name, thumbnail) in enumerate(get_gallery_page(page * GALLERY_PAGE_SIZE, GALLERY_PAGE_SIZE)):
+        with columns[i % GALLERY_COLUMNS]:
+            if thumbnail:
+                st.image(thumbnail, width=100, caption=name)
+            else:
+                st.caption(f"{name} (no preview)")
+
+    if pages > 1:
+        col1, col2, col3 = st.columns([1, 2, 1])
+        with col1:
+            st.button("Previous", disabled=page == 0, key="gallery_prev",
+                      on_click=st.session_state.__setitem__, args=("gallery_page", page - 1))
+        with col2:
+            st.caption(f"Page {page + 1} of {pages} ({total} images)")
+        with col3:
+            st.button("Next", disabled=page == pages - 1, key="gallery_next",
+                      on_click=st.session_state.__setitem__, args=("gallery_page", page + 1))
+
+
+def show_chat_message(sender, message, image):
+    if image:
+        st.markdown(
+            f"<div style='background-color:#fffbe6; padding:8px; border-radius:5px; margin:4px 0;'>"
+            f"<b>{sender.capitalize()} sent an image:</b></div>",
+            unsafe_allow_html=True
+        )
+        st.image(image)
+    elif sender == "user":
+        st.markdown(
+            f"<div style='background-color:#e6f7ff; padding:8px; border-radius:5px; margin:4px 0;'>"
+            f"<b>User:</b> {message}</div>",
+            unsafe_allow_html=True
+        )
+    else:
+        st.markdown(
+            f"<div style='background-color:#fffbe6; padding:8px; border-radius:5px; margin:4px 0;'>"
+            f"<b>Agent:</b> {message}</div>",
+            unsafe_allow_html=True
+        )
+
+
+@st.fragment
+def show_chat(client_id, pages_key):
+    """Latest CHAT_PAGE_SIZE messages, plus one more page per "Load older messages" click."""
+    if st.session_state.get(f"{pages_key}_client") != client_id:
+        st.session_state[f"{pages_key}_client"] = client_id
+        st.session_state[pages_key] = 1
+
+    pages, older = [], None
+    for _ in range(st.session_state[pages_key]):
+        rows, older = fetch_chat_page(client_id, older)
+        pages.insert(0, rows)
+        if older is None:
+            break
+
+    if not pages[-1]:
+        st.write("No chat history available.")
+        return
+    if older is not None:
+        st.button("Load older messages", key=f"{pages_key}_older",
+                  on_click=st.session_state.__setitem__, args=(pages_key, st.session_state[pages_key] + 1))
+    for rows in pages:
+        for _, sender, message, image_ref, image_hash in rows:
+            image = fetch_chat_image(image_ref, image_hash) if image_ref is not None or image_hash is not None else None
+            show_chat_message(sender, message, image)
+
+
+@st.fragment(run_every="2s")
+def show_search_jobs():
+    jobs = recent_jobs()
+    if not jobs:
+        st.info("No client searches yet.")
+        return
+    for job in jobs:
+        progress = job["progress"] or {}
+        scanned, total = progress.get("customers_scanned", 0), progress.get("customers_total", 0)
+        col1, col2 = st.columns([5, 1])
+        with col1:
+            st.markdown(f"**Job #{job['id']}** — {job['status']}")
+            if job["status"] == "running":
+                st.progress(min(scanned / total, 1.0) if total else 0.0,
+                            text=f"{scanned}/{total} customers scanned, {progress.get('candidates', 0)} matches, "
+                                 f"{progress.get('reasons_generated', 0)} reasons generated")
+            elif job["status"] == "done":
+                st.caption(f"{job['result']['clients']} potential clients found")
+            elif job["status"] == "failed":
+                st.caption(job["error"].splitlines()[0])
+        with col2:
+            if job["status"] in ("queued", "running") and not job["cancel_requested"]:
+                st.button("Cancel", key=f"cancel_job_{job['id']}", on_click=cancel_job, args=(job["id"],))
+
+
+TRACE_SUMMARY_SPANS = int(os.getenv("TRACE_SUMMARY_SPANS", "20000"))
+SLOWEST_QUERIES = 15
+
+
+def set_tracing():
+    tracing.set_enabled(st.session_state["trace_enabled"])
+
+
+@st.fragment
+def show_diagnostics():
+    st.subheader("Intent router")
+    stats = router_stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Routed requests", stats["routed"])
+    col2.metric("LLM calls saved", stats["saved_calls"])
+    col3.metric("Seconds saved (est.)", f"{stats['saved_seconds']:.1f}")
+
+    st.subheader("Traces")
+    st.toggle("Record traces", value=tracing.enabled, key="trace_enabled", on_change=set_tracing,
+              help=f"Times every tool, query, OpenAI call and image decode into {tracing.TRACE_FILE}")
+    records = tracing.read_spans(TRACE_SUMMARY_SPANS)
+    if not records:
+        st.info("No spans recorded yet.")
+        return
+
+    costs = [record["cost_usd"] for record in records if record.get("cost_usd") is not None]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Spans", len(records))
+    col2.metric("Tokens", sum((record.get("input_tokens") or 0) + (record.get("output_tokens") or 0) for record in records))
+    col3.metric("Cost (USD)", f"{sum(costs):.4f}")
+
+    st.markdown("**Time by span**")
+    st.dataframe(tracing.summarize(records), hide_index=True)
+    st.markdown("**Slowest queries**")
+    queries = tracing.summarize([record for record in records if record["kind"] == "db"], by="sql")
+    st.dataframe(queries[:SLOWEST_QUERIES], hide_index=True)
+
+    col1, col2 = st.columns(2)
+    col1.button("Refresh", key="trace_refresh")
+    col2.button("Clear traces", key="trace_clear", on_click=tracing.clear)
+
+
+@st.cache_resource
+def init_databases():
+    """Creates and migrates the databases once per process, not on every rerun."""
+    init_db()
+    init_chat_db()
+    init_potential_clients_db()
+    init_jobs_db()
+
+
+init_databases()
+start_worker()
 
 st.set_page_config(page_title="Sales Agent", layout="centered")
-tab1, tab2 = st.tabs(["Craftsman interface", "Dummy user interface"])
+tab1, tab2, tab3 = st.tabs(["Craftsman interface", "Dummy user interface", "Diagnostics"])
 
 # Tab 1: Craftsman Interface
 with tab1:
@@ -76,20 +250,32 @@ with tab1:
     uploaded_files = st.file_uploader("Choose images", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
 
     if uploaded_files:
-        for file in uploaded_files:
-            image_bytes = file.read()
-            with st.spinner("Analyzing with AI..."):
-                metadata = extract_metadata_from_image(image_bytes)
-            save_image_with_metadata(file.name, image_bytes, metadata)
-            st.success(f"{file.name} saved with metadata")
+        progress_bar = st.progress(0.0, text="Analyzing with AI...")
+        file_status = [st.empty() for _ in uploaded_files]
+
+        def show_progress(index, result, done, total):
+            progress_bar.progress(done / total, text=f"Analyzed {done}/{total} images")
+            if result["status"] == "failed":
+                file_status[index].error(f"{result['name']} failed: {result['error']}")
+            else:
+                file_status[index].info(f"{result['name']} analyzed")
+
+        results = ingest_images([(file.name, file.getvalue()) for file in uploaded_files], on_progress=show_progress)
+        progress_bar.empty()
+        for placeholder, result in zip(file_status, results):
+            if result["status"] == "failed":
+                placeholder.error(f"{result['name']} failed: {result['error']}")
+            else:
+                placeholder.success(f"{result['name']} saved with metadata")
 
     st.subheader("Stored Handicrafts")
-    images_data = get_images_with_metadata()
-    if images_data:
-        for name, img_blob, metadata in images_data:
-            st.image(img_blob, width=100)
-    else:
-        st.info("No images uploaded yet.")
+    show_gallery()
+
+    st.divider()
+    st.header("Client Search")
+    if st.button("Refresh potential clients"):
+        submit_refresh()
+    show_search_jobs()
 
     #  Divider: Potential Clients Section
     st.divider()
@@ -124,15 +310,19 @@ with tab1:
             st.success(f"Selected Clients: {selected_users}")
 
         if st.button("Send Message to Selected Clients"):
-            user_query = f"send message to these users: {selected_users}"
-            status_placeholder = st.empty()
-            response = safe_async_run(stream_agent(user_query, status_placeholder))
-            status_placeholder.empty()
-
-            for name in selected_users:
-                mark_client_messaged(name)
-
-            st.success("Messages sent successfully!")
+            with st.spinner(f"Sending pitches to {len(selected_users)} clients..."):
+                # reason_generator does its own retries, so the shared client's are turned off
+                try:
+                    results = run(send_pitches(selected_users, client=openai_client().with_options(max_retries=0)))
+                except TimeoutError:
+                    results = []
+                    st.error("Sending pitches timed out.")
+
+            failed = [result for result in results if result["status"] == "failed"]
+            if len(failed) < len(results):
+                st.success(f"Messages sent to {len(results) - len(failed)} of {len(results)} clients!")
+            for result in failed:
+                st.error(f"{result['name']}: {result['error']}")
 
     else:
         st.info("No potential clients found.")
@@ -140,35 +330,9 @@ with tab1:
     #  Chat Popup View
     if st.session_state["open_chat"]:
         name = st.session_state["open_chat"]
-        chats = fetch_chat_history(name)
-
         st.markdown("---")
         st.markdown(f"## 💬 Chat History with {name}")
-
-        if chats:
-            for sender, message, image in chats:
-                if image:
-                    st.markdown(
-                        f"<div style='background-color:#fffbe6; padding:8px; border-radius:5px; margin:4px 0;'>"
-                        f"<b>{sender.capitalize()} sent an image:</b></div>",
-                        unsafe_allow_html=True
-                    )
-                    st.image(image)
-                else:
-                    if sender == "user":
-                        st.markdown(
-                            f"<div style='background-color:#e6f7ff; padding:8px; border-radius:5px; margin:4px 0;'>"
-                            f"<b>User:</b> {message}</div>",
-                            unsafe_allow_html=True
-                        )
-                    else:
-                        st.markdown(
-                            f"<div style='background-color:#fffbe6; padding:8px; border-radius:5px; margin:4px 0;'>"
-                            f"<b>Agent:</b> {message}</div>",
-                            unsafe_allow_html=True
-                        )
-        else:
-            st.write("No chat history available.")
+        show_chat(chat_client_id(name), "craftsman_chat_pages")
 
         if st.button("Close Chat Window"):
             st.session_state["open_chat"] = None
@@ -189,7 +353,7 @@ with tab1:
     if send and user_query:
         st.session_state["craftsman_chat_history"].append(("user", user_query))
 
-        response = safe_async_run(stream_agent(user_query, status_placeholder))
+        response = stream_agent(user_query, status_placeholder, response_placeholder)
         st.session_state["craftsman_chat_history"].append(("agent", response))
 
         status_placeholder.empty()
@@ -199,32 +363,7 @@ with tab2:
     st.title("🧵 Chat with Sales Agent")
 
     st.subheader("Chat History")
-    chats = chat_history_user()
-
-    if chats:
-        for chat_id, sender, message, image in chats:
-            if image:
-                st.markdown(
-                    f"<div style='background-color:#fffbe6; padding:8px; border-radius:5px; margin:4px 0;'>"
-                    f"<b>{sender.capitalize()} sent an image:</b></div>",
-                    unsafe_allow_html=True
-                )
-                st.image(image)
-            else:
-                if sender == "user":
-                    st.markdown(
-                        f"<div style='background-color:#e6f7ff; padding:8px; border-radius:5px; margin:4px 0;'>"
-                        f"<b>User:</b> {message}</div>",
-                        unsafe_allow_html=True
-                    )
-                else:
-                    st.markdown(
-                        f"<div style='background-color:#fffbe6; padding:8px; border-radius:5px; margin:4px 0;'>"
-                        f"<b>Agent:</b> {message}</div>",
-                        unsafe_allow_html=True
-                    )
-    else:
-        st.write("No chat history available.")
+    show_chat(DUMMY_CLIENT_ID, "dummy_chat_pages")
 
     st.subheader("Send Message to Agent")
 
@@ -235,10 +374,14 @@ with tab2:
         user_query_dummy = f"Hardik Sharma replied with: {user_query1}"
         status_placeholder = st.empty()
 
-        agent_response = safe_async_run(stream_agent(user_query_dummy, status_placeholder))
+        agent_response = stream_agent(user_query_dummy, status_placeholder)
         status_placeholder.empty()
         st.markdown("Message sent. Please refresh.")
 
     if st.button("🔄 Reset Chat"):
         reset_chat_history_preserve_first()
         st.success("Chat reset!")
+
+# Tab 3: Diagnostics
+with tab3:
+    show_diagnostics()
@@ -0,0 +1,116 @@
+"""
+One long-lived asyncio event loop per process, on a daemon thread, shared by
+every Streamlit session and rerun.
+
+Streamlit runs each script run on its own thread, so coroutines are handed to
+this loop instead of a loop made per click: run() waits for a result with a
+timeout, and iterate() drives an async generator (the agent's event stream)
+from the calling thread, so the script can update its elements between
+events. Agent runs from different sessions run concurrently on the loop.
+
+openai_client() is the AsyncOpenAI client the agent and its tools share. Its
+httpx pool keeps connections alive between calls (over HTTP/2 unless
+OPENAI_HTTP2=0), so TLS and connection setup are paid once instead of per
+call. An httpx client belongs to the loop it first ran on: use it only from
+coroutines running here.
+"""
+import os
+import time
+import asyncio
+import threading
+
+RUN_TIMEOUT = float(os.getenv("ASYNC_RUN_TIMEOUT", "300"))
+HTTP2 = os.getenv("OPENAI_HTTP2", "1") != "0"
+MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = 60.0
+
+_loop = None
+_loop_lock = threading.Lock()
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_loop():
+    """The shared loop, started on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="async-runtime", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def submit(coro):
+    """Schedules `coro` on the shared loop; returns a concurrent.futures.Future for its result."""
+    loop = get_loop()
+    try:
+        running = asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        # waiting on the future from the loop's own thread would never return
+        coro.close()
+        raise RuntimeError("async_runtime.submit() called from the runtime loop; await the coroutine instead")
+    return asyncio.run_coroutine_threadsafe(coro, loop)
+
+
+def run(coro, timeout=RUN_TIMEOUT):
+    """Runs `coro` on the shared loop and returns its result; after `timeout` seconds it is cancelled and TimeoutError raised."""
+    future = submit(coro)
+    try:
+        return future.result(timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+
+
+async def _aclose(agen):
+    try:
+        await agen.aclose()
+    except RuntimeError:
+        # still unwinding a cancelled __anext__
+        pass
+
+
+def iterate(agen, timeout=RUN_TIMEOUT):
+    """
+    Yields the items of the async generator `agen`, produced on the shared
+    loop, in the calling thread. The whole iteration is bounded by `timeout`
+    (TimeoutError); stopping early closes `agen`.
+    """
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    try:
+        while True:
+            future = submit(agen.__anext__())
+            try:
+                item = future.result(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except StopAsyncIteration:
+                return
+            except TimeoutError:
+                future.cancel()
+                raise
+            yield item
+    finally:
+        submit(_aclose(agen))
+
+
+def openai_client():
+    """The shared AsyncOpenAI client, created on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            # openai takes most of a second to import; only pay for it once a client is needed
+            import httpx
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+            _client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=os.getenv("OPENAI_BASE_URL") or None,
+                http_client=DefaultAsyncHttpxClient(
+                    http2=HTTP2,
+                    limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE,
+                                        keepalive_expiry=KEEPALIVE_EXPIRY)
+                )
+            )
+        return _client
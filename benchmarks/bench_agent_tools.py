@@ -0,0 +1,221 @@
+"""
+End-to-end latency of the agent tools and of a full CraftSalesAssistant run,
+offline, against the local mock chat completions server.
+
+    python benchmarks/bench_agent_tools.py [--crafts 50] [--customers 2000]
+        [--clients 200] [--iterations 50] [--refresh-iterations 3]
+        [--concurrency 1 8] [--latency 0.3] [--jitter 0.1] [--error-rate 0.0]
+
+Generates crafts, customers and potential clients in a temporary directory,
+starts mock_openai_server with scripted replies and tool calls, and points the
+app at it (OPENAI_BASE_URL, so the agent uses chat completions). Each case is
+run --iterations times at every --concurrency level on async_runtime's shared
+loop, as in the app, and reported as p50/p95/p99 latency in ms and calls per
+second. Tools are invoked through their FunctionTool, the same path the agent
+uses.
+
+search_client only queues a job, so 'refresh job' times the queued refresh
+itself (full refresh, clients table emptied first, so every run generates all
+reasons). 'framer (cached)' repeats names and is served from the completion
+cache; 'framer' bypasses it. 'ask (agent)' and 'ask (routed)' send the same
+prompts through ask_agent with the intent router off and on; prompts the
+router does not recognize go to the agent either way.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(tempfile.mkdtemp(prefix="bench_agent_tools_"))
+
+from mock_openai_server import MockOpenAIServer
+from bench_customer_scan import make_db, ITEMS
+
+PITCH_REPLY = "Hi! This handmade piece from our artisans matches what you love - take a look."
+AGENT_REPLY = "Done - the request has been completed."
+TOOL_SCRIPT = [
+    [r"pitch to (?P<name>.+)$", "message_framer", {"name": "{name}"}],
+    [r"pitch to (?P<name>.+)$", "sender_tool", {"name": "{name}", "message": "{tool_output}"}],
+    [r"photo for (?P<name>.+)$", "image_sender_tool", {"name": "{name}", "agent_message": "handmade clay vase"}],
+    [r"refresh", "search_client", {"full_refresh": False}],
+]
+CRAFT_WORDS = {
+    "type": ["vase", "scarf", "basket", "lamp", "stool", "plate", "mat", "bag"],
+    "style": ["rustic", "boho", "modern", "traditional"],
+    "color": ["blue", "red", "green", "brown", "white"],
+    "material": ["clay", "silk", "bamboo", "jute", "brass", "cane"],
+}
+
+
+def seed(crafts, customers, clients):
+    from db import init_db, save_images_batch
+    from client_search import init_potential_clients_db
+    from function_handler import init_chat_db, fetch_messaged_clients
+    from connections import get_connection
+    from jobs import init_jobs_db
+
+    rng = random.Random(1)
+    init_db()
+    init_chat_db()
+    init_potential_clients_db()
+    init_jobs_db()
+    fetch_messaged_clients()
+    save_images_batch([
+        (f"craft_{i}.png", f"craft {i}".encode(), {key: rng.choice(words) for key, words in CRAFT_WORDS.items()}, None, None)
+        for i in range(crafts)
+    ])
+    make_db("meesho.db", customers)
+    get_connection("potential_clients").executemany(
+        "INSERT INTO clients (name, email, reason) VALUES (?, ?, ?)",
+        [(f"Client {i}", f"client{i}@example.com", f"Bought a {rng.choice(ITEMS).lower()} and likes {rng.choice(CRAFT_WORDS['material'])}")
+         for i in range(clients)]
+    )
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+async def measure(call, iterations, concurrency):
+    """Runs call(i) for i in range(iterations), at most `concurrency` at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+
+    async def one(i):
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                result = await call(i)
+                # tools report failures as text; the SDK turns exceptions into "An error occurred..."
+                if isinstance(result, str) and result.startswith(("Error", "Failed", "Message failed", "An error occurred")):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(iterations)))
+    elapsed = time.perf_counter() - start
+    return {
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "ops": iterations / elapsed,
+        "errors": errors,
+    }
+
+
+def invoke(tool, **arguments):
+    from agents.tool_context import ToolContext
+
+    context = ToolContext(context=None, tool_call_id=f"call_bench_{random.getrandbits(32):08x}")
+    return tool.on_invoke_tool(context, json.dumps(arguments))
+
+
+async def run_cases(args, clients):
+    import agent_handler
+    from agents import Runner
+    from connections import get_connection
+    from jobs import get_job
+
+    agent = agent_handler.get_agent()
+    tools = {tool.name: tool for tool in agent.tools}
+
+    def refresh(i):
+        get_connection("potential_clients").execute("DELETE FROM clients WHERE customer_id IS NOT NULL")
+
+        async def run():
+            # search_client starts the job worker and returns "... job #<id> ..."
+            job_id = int(re.search(r"#(\d+)", await invoke(tools["search_client"], full_refresh=True)).group(1))
+            while get_job(job_id)["status"] in ("queued", "running"):
+                await asyncio.sleep(0.05)
+            return "Failed" if get_job(job_id)["status"] != "done" else "done"
+        return run()
+
+    prompts = [lambda i: f"Send a pitch to {clients[i % len(clients)]}",
+               lambda i: f"Send a photo for {clients[i % len(clients)]}",
+               lambda i: "Please refresh the potential clients",
+               lambda i: "How many clients did we message today?"]
+    def ask(routed):
+        def call(i):
+            agent_handler.ROUTER_ENABLED = routed
+            return agent_handler.ask_agent(prompts[i % len(prompts)](i))
+        return call
+
+    cases = [
+        ("search_client", lambda i: invoke(tools["search_client"]), args.iterations),
+        ("refresh job", refresh, args.refresh_iterations),
+        ("framer", lambda i: invoke(tools["message_framer"], name=clients[i % len(clients)], bypass_cache=True), args.iterations),
+        ("framer (cached)", lambda i: invoke(tools["message_framer"], name=clients[i % 10]), args.iterations),
+        ("image_sender", lambda i: invoke(tools["image_sender_tool"], name=clients[i % len(clients)],
+                                          agent_message=f"our {random.choice(CRAFT_WORDS['material'])} {random.choice(CRAFT_WORDS['type'])}"), args.iterations),
+        ("sender", lambda i: invoke(tools["sender_tool"], name=clients[i % len(clients)], message=PITCH_REPLY), args.iterations),
+        ("Runner.run", lambda i: Runner.run(agent, prompts[i % len(prompts)](i)), args.iterations),
+        ("ask (agent)", ask(False), args.iterations),
+        ("ask (routed)", ask(True), args.iterations),
+    ]
+
+    print(f"{'case':>16} {'conc':>5} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'calls/s':>8} {'errors':>6}")
+    for label, call, iterations in cases:
+        for concurrency in args.concurrency:
+            # the refresh job runs one at a time in the worker anyway
+            if label == "refresh job" and concurrency > 1:
+                continue
+            result = await measure(call, iterations, concurrency)
+            print(f"{label:>16} {concurrency:>5} {iterations:>5} {result['p50']:>9.1f} {result['p95']:>9.1f} "
+                  f"{result['p99']:>9.1f} {result['ops']:>8.2f} {result['errors']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--crafts", type=int, default=50)
+    parser.add_argument("--customers", type=int, default=2000)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--refresh-iterations", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                              reply=AGENT_REPLY, replies=[[r"client and product details", PITCH_REPLY]],
+                              tool_script=TOOL_SCRIPT).start()
+    os.environ.update(OPENAI_BASE_URL=server.base_url, OPENAI_API_KEY="mock", OPENAI_AGENTS_DISABLE_TRACING="1",
+                      # SDK tracing is off, so the router cannot observe planner latency; use the mock's
+                      PLANNER_CALL_SECONDS=str(args.latency + args.jitter / 2),
+                      REASON_RATE_PER_SEC=os.getenv("REASON_RATE_PER_SEC", "200"),
+                      REASON_MAX_IN_FLIGHT=os.getenv("REASON_MAX_IN_FLIGHT", "32"))
+    try:
+        start = time.perf_counter()
+        seed(args.crafts, args.customers, args.clients)
+        print(f"seeded {args.crafts} crafts, {args.customers:,} customers, {args.clients} clients in "
+              f"{time.perf_counter() - start:.1f}s; mock latency {args.latency}s + up to {args.jitter}s, "
+              f"error rate {args.error_rate}")
+        clients = [f"Client {i}" for i in range(args.clients)]
+        # on the app's shared loop, where the pooled OpenAI client lives
+        from async_runtime import run
+        run(run_cases(args, clients), timeout=None)
+        print(f"mock server: {server.stats['requests']} requests, {server.stats['tool_calls']} tool calls, "
+              f"{server.stats['errors']} injected errors, max {server.stats['max_in_flight']} in flight")
+        from intent_router import router_stats
+        stats = router_stats()
+        print(f"router: {stats['routed']} requests routed, {stats['saved_calls']} LLM calls "
+              f"(~{stats['saved_seconds']:.1f}s) saved")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
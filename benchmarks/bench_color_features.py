@@ -0,0 +1,65 @@
+"""
+Compares the thumbnail/NumPy colour extractor with the old full-resolution
+Image.getcolors path on generated multi-megapixel JPEGs.
+
+    python benchmarks/bench_color_features.py [--images 300] [--megapixels 12]
+"""
+import io
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+from color_features import extract_color_features
+
+
+def make_jpeg(rng, megapixels):
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    # smooth gradient plus noise, so JPEG sizes look like real photos
+    base = rng.integers(0, 256, size=(8, 8, 3), dtype=np.uint8)
+    image = Image.fromarray(base).resize((width, height), Image.BILINEAR)
+    noise = rng.integers(-12, 12, size=(height, width, 3))
+    pixels = np.clip(np.asarray(image, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def old_dominant_color(image_bytes):
+    image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    colors = image.getcolors(maxcolors=1000000)
+    if colors:
+        return max(colors, key=lambda item: item[0])[1]
+    return None
+
+
+def measure(fn, blobs):
+    start = time.perf_counter()
+    for blob in blobs:
+        fn(blob)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=300)
+    parser.add_argument("--megapixels", type=float, default=12)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"Generating {args.images} JPEGs at {args.megapixels} MP...")
+    blobs = [make_jpeg(rng, args.megapixels) for _ in range(args.images)]
+    print(f"Average size {sum(map(len, blobs)) / len(blobs) / 1e6:.2f} MB")
+
+    for label, fn in [("getcolors (old)", old_dominant_color), ("thumbnail+numpy", extract_color_features)]:
+        elapsed = measure(fn, blobs)
+        print(f"{label:>16}: {elapsed:8.2f}s total, {elapsed / len(blobs) * 1000:8.1f} ms/image")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+FTS5 trigram index lookup (customer_index.match_customers) against the
+streaming full scan (customer_scan.scan_customers, in-process).
+
+    python benchmarks/bench_customer_index.py [--customers 1000000] [--triggers 300]
+
+Runs on a generated customers table in a temporary directory and reports the
+index build time and size. It then times two lookups:
+- a full match with every trigger
+- rescans for a few rare and a few common new triggers, which is what an
+  incremental refresh runs after new crafts arrive
+- a rescan for triggers spanning two fields of the text blob, and one for
+  short and non-ASCII triggers (answered by the scan)
+Both paths must return identical matches.
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_customer_scan import make_db, make_triggers, ITEMS
+
+
+def timed(chunks):
+    start = time.perf_counter()
+    matches = [candidate for _, chunk in chunks for candidate in chunk]
+    return time.perf_counter() - start, matches
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--customers", type=int, default=1_000_000)
+    parser.add_argument("--triggers", type=int, default=300)
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp(prefix="bench_customer_index_"))
+    make_db("meesho.db", args.customers)
+    table_mb = os.path.getsize("meesho.db") / 1024 / 1024
+
+    from customer_scan import scan_customers
+    from customer_index import build_index, match_customers
+
+    start = time.perf_counter()
+    build_index()
+    build_seconds = time.perf_counter() - start
+    index_mb = os.path.getsize("meesho.db") / 1024 / 1024 - table_mb
+    print(f"{args.customers:,} customers ({table_mb:.0f} MB); index built in {build_seconds:.1f}s (+{index_mb:.0f} MB)")
+
+    triggers = make_triggers(args.triggers)
+    rare = ["999 mg road", "101 mg road", "zzqx", "qwerty"]
+    common = ["kolkata", "marble coaster"]
+    # last_bought_item followed by the first liked product
+    spanning = [f"{ITEMS[0]} {ITEMS[1]}".lower(), f"{ITEMS[1]} {ITEMS[0]}".lower()]
+    unindexable = ["mg", "kölkata"]
+    scenarios = [
+        (f"full, {len(triggers)} triggers", triggers, None),
+        (f"rescan, {len(rare)} rare new", triggers + rare, rare),
+        (f"rescan, {len(common)} common new", triggers + common, common),
+        (f"rescan, {len(spanning)} spanning new", triggers + spanning, spanning),
+        (f"rescan, {len(unindexable)} unindexable", triggers + unindexable, unindexable),
+    ]
+    print(f"{'lookup':>22} {'scan s':>8} {'index s':>8} {'speedup':>8} {'matches':>9} {'same':>5}")
+    for label, all_triggers, new in scenarios:
+        scan_seconds, scanned = timed(scan_customers(all_triggers, 0, args.customers, new_triggers=new, workers=1))
+        index_seconds, indexed = timed(match_customers(all_triggers, 0, args.customers, new_triggers=new))
+        print(f"{label:>22} {scan_seconds:>8.2f} {index_seconds:>8.2f} {scan_seconds / index_seconds:>7.1f}x "
+              f"{len(indexed):>9,} {str(scanned == indexed):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Memory and throughput of the customer scan: the old fetchall() + single-core
+loop against customer_scan.scan_customers with 1..N worker processes.
+
+    python benchmarks/bench_customer_scan.py [--customers 2000000] [--workers 1 2 4]
+        [--chunk-size 20000] [--triggers 300]
+
+A customers table is generated in a temporary directory. Each mode runs in its
+own subprocess so its peak RSS can be read on its own. Worker RSS is reported
+separately, as the largest child. The in-process scan reads through the pooled
+connection, so its RSS also counts up to connections.MMAP_SIZE of mapped
+database pages, which the OS can drop at any time.
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import resource
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+ITEMS = ["Wooden Spoon", "Clay Plate", "Woven Mat", "Straw Basket", "Cane Lamp",
+         "Bamboo Stool", "Ceramic Vase", "Brass Diya", "Jute Bag", "Terracotta Pot",
+         "Madhubani Painting", "Block Print Saree", "Silk Scarf", "Marble Coaster"]
+CITIES = ["Delhi", "Mumbai", "Bangalore", "Jaipur", "Kolkata", "Chennai", "Pune"]
+
+
+def make_db(path, count):
+    rng = random.Random(42)
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, address TEXT,
+                                last_bought_item TEXT, liked_products TEXT, email TEXT)
+    """)
+    conn.executemany(
+        "INSERT INTO customers (name, address, last_bought_item, liked_products, email) VALUES (?, ?, ?, ?, ?)",
+        ((f"Customer {i}", f"{rng.randint(1, 999)} MG Road, {rng.choice(CITIES)}", rng.choice(ITEMS),
+          ", ".join(rng.sample(ITEMS, 3)), f"customer{i}@example.com") for i in range(count))
+    )
+    conn.commit()
+    conn.close()
+
+
+def make_triggers(count):
+    rng = random.Random(7)
+    words = [w.lower() for item in ITEMS for w in item.split()]
+    triggers = set(rng.sample(words, 4))
+    while len(triggers) < count:
+        triggers.add("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(5, 9))))
+    return sorted(triggers)
+
+
+def run_mode(mode, workers, chunk_size, triggers):
+    """Runs inside the subprocess, with the temporary directory as cwd."""
+    from trigger_matcher import TriggerMatcher
+    from customer_scan import scan_customers, text_blob
+
+    start = time.perf_counter()
+    matched = 0
+    if mode == "fetchall":
+        conn = sqlite3.connect("meesho.db")
+        rows = conn.execute("SELECT id, name, address, last_bought_item, liked_products, email FROM customers").fetchall()
+        matcher = TriggerMatcher(triggers)
+        for id_, name, address, last_bought, liked, email in rows:
+            if matcher.match(text_blob(address, last_bought, liked)):
+                matched += 1
+        scanned = len(rows)
+    else:
+        conn = sqlite3.connect("meesho.db")
+        scanned = conn.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+        last_id = conn.execute("SELECT MAX(id) FROM customers").fetchone()[0]
+        for _, candidates in scan_customers(triggers, 0, last_id, chunk_size=chunk_size, workers=workers):
+            matched += len(candidates)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        "seconds": elapsed,
+        "scanned": scanned,
+        "matched": matched,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "child_rss_mb": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--customers", type=int, default=2_000_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chunk-size", type=int, default=20000)
+    parser.add_argument("--triggers", type=int, default=300)
+    parser.add_argument("--run", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    triggers = make_triggers(args.triggers)
+
+    if args.run:
+        run_mode(args.run[0], int(args.run[1]), args.chunk_size, triggers)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="bench_customer_scan_")
+    start = time.perf_counter()
+    make_db(os.path.join(workdir, "meesho.db"), args.customers)
+    size_mb = os.path.getsize(os.path.join(workdir, "meesho.db")) / 1024 / 1024
+    print(f"generated {args.customers:,} customers ({size_mb:.0f} MB) in {time.perf_counter() - start:.1f}s, "
+          f"{os.cpu_count()} CPUs")
+
+    print(f"{'mode':>12} {'seconds':>8} {'rows/s':>10} {'matched':>9} {'rss MB':>7} {'worker MB':>9}")
+    for mode, workers in [("fetchall", 1)] + [("stream", w) for w in args.workers]:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--run", mode, str(workers),
+             "--chunk-size", str(args.chunk_size), "--triggers", str(args.triggers)],
+            cwd=workdir, capture_output=True, text=True, check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        label = mode if mode == "fetchall" else f"stream x{workers}"
+        worker_mb = f"{result['child_rss_mb']:.0f}" if workers > 1 else "-"
+        print(f"{label:>12} {result['seconds']:>8.2f} {result['scanned'] / result['seconds']:>10,.0f} "
+              f"{result['matched']:>9,} {result['rss_mb']:>7.0f} {worker_mb:>9}")
+
+
+if __name__ == "__main__":
+    main()
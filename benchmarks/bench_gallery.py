@@ -0,0 +1,143 @@
+"""
+Rerun latency and memory of the Stored Handicrafts gallery: the old listing,
+which read every original BLOB and metadata JSON and rendered all of them,
+against the paged thumbnail gallery in app.py.
+
+    python benchmarks/bench_gallery.py [--images 1000 10000] [--reruns 5]
+        [--width 800] [--height 600]
+
+For each catalog size an images.db is generated in a temporary directory (one
+synthetic JPEG, made unique per row by trailing bytes, so every row carries a
+full-size original). Each mode runs in its own subprocess under Streamlit's
+AppTest and reports the first run, the median of --reruns reruns and peak RSS.
+'blob' is a script holding only the old gallery code; 'app' is the whole of
+app.py, so its numbers include everything else on the page too.
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import statistics
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BLOB_GALLERY = f"""
+import sys, json
+sys.path.insert(0, {ROOT!r})
+import streamlit as st
+from connections import get_connection
+
+rows = get_connection("images").execute("SELECT name, image, metadata FROM images").fetchall()
+for name, img_blob, metadata in [(name, blob, json.loads(metadata)) for name, blob, metadata in rows]:
+    st.image(img_blob, width=100)
+"""
+
+
+def make_image(width, height):
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(1)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    pixels = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    out = io.BytesIO()
+    Image.fromarray(pixels).save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def make_db(count, width, height):
+    """Runs with the temporary directory as cwd."""
+    from db import init_db, save_images_batch
+    from thumbnails import make_thumbnail
+    from client_search import init_potential_clients_db
+
+    init_db()
+    init_potential_clients_db()
+    image = make_image(width, height)
+    thumbnail = make_thumbnail(image)
+    metadata = {"type": "vase", "style": "rustic", "color": "blue", "material": "clay",
+                "estimated_size": "medium", "handcrafted": "yes"}
+    for start in range(0, count, 500):
+        save_images_batch([(f"craft_{i}.jpg", image + i.to_bytes(4, "big"), metadata, None, thumbnail)
+                           for i in range(start, min(start + 500, count))])
+    return len(image)
+
+
+def count_images(node):
+    return sum(count_images(child) + (getattr(child, "type", None) == "image")
+               for child in getattr(node, "children", {}).values())
+
+
+def run_mode(mode, reruns):
+    """Runs inside the subprocess, with the temporary directory as cwd."""
+    from streamlit.testing.v1 import AppTest
+
+    if mode == "blob":
+        at = AppTest.from_string(BLOB_GALLERY, default_timeout=600)
+    else:
+        at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=600)
+    start = time.perf_counter()
+    at.run()
+    first = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - start)
+    print(json.dumps({
+        "first": first,
+        "rerun": statistics.median(times),
+        "images": count_images(at.main),
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--width", type=int, default=800)
+    parser.add_argument("--height", type=int, default=600)
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--make", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        run_mode(args.run, args.reruns)
+        return
+    if args.make:
+        print(make_db(args.make, args.width, args.height))
+        return
+
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "mock"))
+    print(f"{'images':>7} {'mode':>5} {'first s':>8} {'rerun s':>8} {'rendered':>9} {'rss MB':>7}")
+    for count in args.images:
+        workdir = tempfile.mkdtemp(prefix="bench_gallery_")
+        image_bytes = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--make", str(count),
+             "--width", str(args.width), "--height", str(args.height)],
+            cwd=workdir, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        size_mb = os.path.getsize(os.path.join(workdir, "images.db")) / 1024 / 1024
+        print(f"# {count:,} images of {int(image_bytes) / 1024:.0f} KB, images.db {size_mb:.0f} MB")
+        for mode in ("blob", "app"):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run", mode, "--reruns", str(args.reruns)],
+                cwd=workdir, env=env, capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{count:>7,} {mode:>5} {result['first']:>8.2f} {result['rerun']:>8.2f} "
+                  f"{result['images']:>9,} {result['rss_mb']:>7.0f}")
+
+
+if __name__ == "__main__":
+    main()
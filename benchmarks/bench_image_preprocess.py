@@ -0,0 +1,57 @@
+"""
+Payload size and encode time of llm_parser.preprocess_image on generated photos.
+
+    python benchmarks/bench_image_preprocess.py [--images 20] [--megapixels 3 12 24]
+"""
+import io
+import os
+import sys
+import base64
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from PIL import Image
+from llm_parser import preprocess_image
+
+
+def make_photo(rng, megapixels):
+    width = int((megapixels * 1_000_000 * 4 / 3) ** 0.5)
+    height = int(width * 3 / 4)
+    base = rng.integers(0, 256, size=(12, 16, 3), dtype=np.uint8)
+    image = Image.fromarray(base).resize((width, height), Image.BICUBIC)
+    noise = rng.integers(-20, 20, size=(height, width, 3))
+    pixels = np.clip(np.asarray(image, dtype=np.int16) + noise, 0, 255).astype(np.uint8)
+    exif = Image.Exif()
+    exif[0x010f] = "Benchmark Phone"
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=95, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=20)
+    parser.add_argument("--megapixels", type=float, nargs="+", default=[3, 12, 24])
+    parser.add_argument("--formats", nargs="+", default=["JPEG", "WEBP"])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'MP':>5} {'format':>6} {'original KB':>12} {'payload KB':>11} {'base64 KB':>10} "
+          f"{'saved':>7} {'encode ms':>10}")
+    for megapixels in args.megapixels:
+        photos = [make_photo(rng, megapixels) for _ in range(args.images)]
+        original = statistics.mean(len(p) for p in photos)
+        for fmt in args.formats:
+            results = [preprocess_image(photo, fmt=fmt) for photo in photos]
+            payload = statistics.mean(len(r[0]) for r in results)
+            encoded = statistics.mean(len(base64.b64encode(r[0])) for r in results)
+            encode_ms = statistics.mean(r[2]["encode_seconds"] for r in results) * 1000
+            print(f"{megapixels:>5g} {fmt:>6} {original / 1024:>12.0f} {payload / 1024:>11.0f} "
+                  f"{encoded / 1024:>10.0f} {1 - payload / original:>6.1%} {encode_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
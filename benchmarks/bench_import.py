@@ -0,0 +1,135 @@
+"""
+Cold-start and per-rerun cost of app.py, for catching import-time regressions.
+
+    python benchmarks/bench_import.py [--runs 5] [--reruns 5] [--top 15]
+        [--budget-ms 0] [--deferred agents openai scipy PIL numpy]
+
+'import' runs `python -X importtime` in a fresh interpreter --runs times,
+importing every module app.py imports (read from its source), and reports the
+median cumulative time of each and their total, plus the --top heaviest
+packages underneath. 'app' runs app.py under Streamlit's AppTest in a fresh
+interpreter and reports the first run (cold imports and database setup) and
+the median of --reruns reruns, which is what every click costs.
+
+Exits with status 1 when the import total exceeds --budget-ms (if set) or
+when any of the --deferred packages is imported at startup; those should
+only load on first use.
+"""
+import os
+import re
+import ast
+import sys
+import json
+import time
+import argparse
+import statistics
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def app_imports():
+    """Top-level modules imported anywhere in app.py, in source order."""
+    with open(os.path.join(ROOT, "app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return list(dict.fromkeys(modules))
+
+
+def import_profile(modules, workdir, env):
+    """({module: cumulative ms}, {top-level module: cumulative ms}) for one fresh interpreter importing `modules`."""
+    code = f"import sys; sys.path.insert(0, {ROOT!r}); " + "; ".join(f"import {module}" for module in modules)
+    stderr = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=workdir, env=env,
+                            capture_output=True, text=True, check=True).stderr
+    cumulative, top_level = {}, {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        _, total_us, indent, name = match.groups()
+        cumulative[name] = int(total_us) / 1000
+        # nested imports are indented under the module that triggered them
+        if len(indent) == 1:
+            top_level[name] = int(total_us) / 1000
+    return cumulative, top_level
+
+
+def run_app(reruns):
+    """Runs inside the subprocess, with the temporary directory as cwd."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    start = time.perf_counter()
+    at.run()
+    first = time.perf_counter() - start
+    if at.exception:
+        raise RuntimeError(at.exception[0].message)
+    times = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - start)
+    print(json.dumps({"first": first, "rerun": statistics.median(times)}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=0)
+    parser.add_argument("--deferred", nargs="*", default=["agents", "openai", "scipy", "PIL", "numpy"])
+    parser.add_argument("--app", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.app:
+        run_app(args.reruns)
+        return
+
+    workdir = tempfile.mkdtemp(prefix="bench_import_")
+    env = dict(os.environ, OPENAI_API_KEY=os.getenv("OPENAI_API_KEY", "mock"))
+    modules = app_imports()
+
+    profiles = [import_profile(modules, workdir, env) for _ in range(args.runs)]
+    print(f"# import: {len(modules)} modules imported by app.py, median of {args.runs} fresh interpreters")
+    print(f"{'module':>24} {'ms':>8}")
+    total = 0.0
+    for module in modules:
+        # a module already pulled in by an earlier import costs nothing here
+        ms = statistics.median(top_level.get(module, 0.0) for _, top_level in profiles)
+        total += ms
+        print(f"{module:>24} {ms:>8.1f}")
+    print(f"{'total':>24} {total:>8.1f}")
+
+    heaviest = sorted(profiles[-1][0].items(), key=lambda item: item[1], reverse=True)
+    print("# heaviest packages (last run, cumulative)")
+    for name, ms in [item for item in heaviest if "." not in item[0]][:args.top]:
+        print(f"{name:>24} {ms:>8.1f}")
+
+    loaded = [package for package in args.deferred if package in profiles[-1][0]]
+    print(f"# deferred packages imported at startup: {', '.join(loaded) or 'none'}")
+
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--app", "--reruns", str(args.reruns)],
+                            cwd=workdir, env=env, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    print(f"# app: first run {result['first'] * 1000:.0f} ms, rerun {result['rerun'] * 1000:.0f} ms "
+          f"(median of {args.reruns})")
+
+    failed = bool(loaded)
+    if args.budget_ms and total > args.budget_ms:
+        print(f"import total {total:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Bulk outreach throughput against the local mock chat completions server.
+
+    python benchmarks/bench_outreach.py [--clients 100] [--latency 0.5]
+        [--error-rate 0.05] [--in-flight 1 8 32] [--rate 100]
+
+in-flight 1 is close to the old path, where the agent framed and sent one
+client at a time (without its extra planner round trips). Each run starts from
+an empty completion cache and empty chat history, and checks that every
+selected client got exactly one chat row and was marked messaged.
+
+Runs in a temporary directory; the project databases are not touched.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="bench_outreach_"))
+
+from openai import AsyncOpenAI
+from mock_openai_server import MockOpenAIServer
+from connections import get_connection
+from db import init_db, save_images_batch
+from client_search import init_potential_clients_db
+from function_handler import init_chat_db, fetch_messaged_clients
+from outreach import send_pitches, get_completion_cache
+
+
+def seed(clients):
+    init_db()
+    init_chat_db()
+    init_potential_clients_db()
+    fetch_messaged_clients()
+    save_images_batch([
+        ("vase.png", b"vase", {"type": "vase", "style": "rustic", "color": "blue", "material": "clay"}, None, None),
+        ("scarf.png", b"scarf", {"type": "scarf", "style": "boho", "color": "red", "material": "silk"}, None, None),
+    ])
+    get_connection("potential_clients").executemany(
+        "INSERT INTO clients (name, email, reason) VALUES (?, ?, ?)",
+        [(f"Client {i}", f"client{i}@example.com", f"Likes {'blue clay vase' if i % 2 else 'red silk scarf'} #{i}")
+         for i in range(clients)]
+    )
+
+
+def reset():
+    get_connection("chat_history").execute("DELETE FROM chat_messages")
+    get_connection("potential_clients").execute("DELETE FROM messaged_clients")
+    get_completion_cache().clear()
+
+
+async def run(server, names, in_flight, rate):
+    client = AsyncOpenAI(api_key="mock", base_url=server.base_url, max_retries=0)
+    try:
+        start = time.perf_counter()
+        results = await send_pitches(names, max_in_flight=in_flight, rate_per_sec=rate, client=client)
+        return time.perf_counter() - start, results
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--rate", type=float, default=100.0)
+    args = parser.parse_args()
+
+    seed(args.clients)
+    names = [f"Client {i}" for i in range(args.clients)]
+    server = MockOpenAIServer(latency=args.latency, error_rate=args.error_rate).start()
+    try:
+        print(f"{'in-flight':>9} {'seconds':>8} {'clients/s':>9} {'sent':>5} {'429s':>5} {'consistent':>10}")
+        for in_flight in args.in_flight:
+            reset()
+            server.stats.update(requests=0, errors=0, max_in_flight=0)
+            elapsed, results = asyncio.run(run(server, names, in_flight, args.rate))
+            sent = {result["name"] for result in results if result["status"] == "sent"}
+            rows = get_connection("chat_history").execute(
+                "SELECT client_id, COUNT(*) FROM chat_messages GROUP BY client_id").fetchall()
+            consistent = (fetch_messaged_clients() == sent
+                          and dict(rows) == {name.lower().replace(" ", "_"): 1 for name in sent})
+            print(f"{in_flight:>9} {elapsed:>8.2f} {len(names) / elapsed:>9.1f} {len(sent):>5} "
+                  f"{server.stats['errors']:>5} {str(consistent):>10}")
+
+        start = time.perf_counter()
+        asyncio.run(run(server, names, args.in_flight[-1], args.rate))
+        print(f"repeat with warm completion cache: {time.perf_counter() - start:.3f}s")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
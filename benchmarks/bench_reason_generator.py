@@ -0,0 +1,60 @@
+"""
+Runs the match-reason pipeline against the local mock chat completions server.
+
+    python benchmarks/bench_reason_generator.py [--matches 500] [--latency 0.3]
+        [--error-rate 0.1] [--error-status 429] [--in-flight 1 8 32] [--rate 50]
+
+The mock echoes each prompt back, so the script also checks that replies come
+back in customer order and that injected errors (429s, or 5xx with
+--error-status 500) are retried.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openai import AsyncOpenAI
+from mock_openai_server import MockOpenAIServer
+from reason_generator import generate_reasons
+
+
+async def run(server, prompts, in_flight, rate):
+    client = AsyncOpenAI(api_key="mock", base_url=server.base_url, max_retries=0)
+    try:
+        start = time.perf_counter()
+        replies = await generate_reasons(prompts, max_in_flight=in_flight, rate_per_sec=rate, client=client)
+        return time.perf_counter() - start, replies
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--matches", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--error-rate", type=float, default=0.1)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--in-flight", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--rate", type=float, default=50.0)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(latency=args.latency, error_rate=args.error_rate, error_status=args.error_status,
+                              echo=True).start()
+    prompts = [f"customer-{i}" for i in range(args.matches)]
+    try:
+        print(f"{'in-flight':>9} {'seconds':>8} {'req/s':>7} {'requests':>9} {'errors':>6} {'ordered':>8}")
+        for in_flight in args.in_flight:
+            server.stats.update(requests=0, errors=0, max_in_flight=0)
+            elapsed, replies = asyncio.run(run(server, prompts, in_flight, args.rate))
+            ordered = replies == prompts
+            print(f"{in_flight:>9} {elapsed:>8.2f} {len(prompts) / elapsed:>7.1f} "
+                  f"{server.stats['requests']:>9} {server.stats['errors']:>6} {str(ordered):>8}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Throughput of TfidfMatcher on synthetic customers x crafts, with the
+Aho-Corasick substring matcher on the crafts' field values for reference.
+
+    python benchmarks/bench_tfidf_matcher.py [--customers 1000000] [--crafts 1000]
+        [--chunk-size 10000] [--k 3] [--threshold 0.1]
+
+Also prints a few near matches ("wood" vs "wooden") and what the substring matcher finds for them.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tfidf_matcher import TfidfMatcher
+from trigger_matcher import TriggerMatcher
+
+TYPES = ["spoon", "plate", "mat", "basket", "lamp", "stool", "vase", "diya", "bag", "pot",
+         "painting", "saree", "scarf", "coaster", "bowl", "rug", "bangle", "toy", "mirror", "box"]
+STYLES = ["rustic", "boho", "madhubani", "block print", "carved", "woven", "painted", "minimal", "tribal", "ikat"]
+COLORS = ["blue", "red", "brown", "green", "ochre", "white", "black", "maroon", "yellow", "indigo"]
+MATERIALS = ["wood", "clay", "jute", "bamboo", "brass", "silk", "cotton", "terracotta", "marble", "cane"]
+ITEMS = ["Wooden Spoon", "Clay Plate", "Woven Mat", "Straw Basket", "Cane Lamp", "Bamboo Stool",
+         "Ceramic Vase", "Brass Diya", "Jute Bag", "Terracotta Pot", "Madhubani Painting",
+         "Block Print Saree", "Silk Scarf", "Marble Coaster", "Cotton Rug", "Painted Bowls"]
+CITIES = ["Delhi", "Mumbai", "Bangalore", "Jaipur", "Kolkata", "Chennai", "Pune"]
+
+
+def make_crafts(count, rng):
+    return [" ".join([rng.choice(TYPES), rng.choice(STYLES), rng.choice(COLORS), rng.choice(MATERIALS)])
+            for _ in range(count)]
+
+
+def make_blobs(count, rng):
+    for _ in range(count):
+        liked = ", ".join(rng.sample(ITEMS, 3))
+        yield f"{rng.choice(ITEMS)} {liked} {rng.randint(1, 999)} MG Road, {rng.choice(CITIES)}, India".lower()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--customers", type=int, default=1_000_000)
+    parser.add_argument("--crafts", type=int, default=1000)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    crafts = make_crafts(args.crafts, rng)
+    blobs = list(make_blobs(args.customers, rng))
+
+    start = time.perf_counter()
+    matcher = TfidfMatcher(crafts)
+    print(f"fit {len(crafts)} crafts: {time.perf_counter() - start:.3f}s, {len(matcher.vocabulary)} n-grams")
+
+    start = time.perf_counter()
+    matched = 0
+    for indices, _ in matcher.iter_top_k(blobs, k=args.k, threshold=args.threshold, chunk_size=args.chunk_size):
+        matched += int((indices[:, 0] >= 0).sum())
+    elapsed = time.perf_counter() - start
+    print(f"tfidf top-{args.k}: {len(blobs)} customers in {elapsed:.2f}s "
+          f"({len(blobs) / elapsed:,.0f}/s), {matched} with a match >= {args.threshold}")
+
+    triggers = {word for craft in crafts for word in craft.split()}
+    substring = TriggerMatcher(triggers)
+    start = time.perf_counter()
+    matched = sum(1 for blob in blobs if substring.match_indices(blob))
+    elapsed = time.perf_counter() - start
+    print(f"substring triggers: {len(blobs)} customers in {elapsed:.2f}s "
+          f"({len(blobs) / elapsed:,.0f}/s), {matched} with a match")
+
+    near_crafts = ["spoon carved brown wooden", "vase painted blue ceramics", "bowl rustic ochre terracotta"]
+    near = TfidfMatcher(near_crafts)
+    near_substring = TriggerMatcher({word for craft in near_crafts for word in craft.split()})
+    for text in ["wood spoon", "ceramic vase", "terra cotta bowls", "delhi, india"]:
+        best = [(near_crafts[i], round(score, 2)) for i, score in near.top_k([text], k=1, threshold=args.threshold)[0]]
+        print(f"  {text!r}: tfidf {best} | substring {near_substring.match(text)}")
+
+if __name__ == "__main__":
+    main()
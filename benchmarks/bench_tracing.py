@@ -0,0 +1,75 @@
+"""
+Cost of the tracing hooks (tracing.py) on the hot paths they wrap, with
+tracing off and on.
+
+    python benchmarks/bench_tracing.py [--calls 200000] [--rows 1000]
+
+'query' runs a primary-key SELECT on a plain sqlite3 connection and on the
+pooled (traced) connection; 'traced fn' calls an empty function with and
+without @traced; 'span' is an empty `with span(...)` block. Each line reports
+microseconds per call. Runs in a temporary directory, so the spans written
+with tracing on go to a throwaway traces.jsonl.
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(tempfile.mkdtemp(prefix="bench_tracing_"))
+
+import tracing
+from connections import get_connection
+
+
+def per_call_us(fn, calls):
+    start = time.perf_counter()
+    for i in range(calls):
+        fn(i)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    plain = sqlite3.connect("images.db", isolation_level=None)
+    plain.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    plain.executemany("INSERT INTO t VALUES (?, ?)", [(i, str(i)) for i in range(args.rows)])
+    pooled = get_connection("images")
+    rows = args.rows
+
+    def empty(i):
+        return i
+
+    traced_empty = tracing.traced("bench")(empty)
+    cases = [
+        ("query (plain)", lambda i: plain.execute("SELECT v FROM t WHERE id = ?", (i % rows,)).fetchone()),
+        ("query (pooled)", lambda i: pooled.execute("SELECT v FROM t WHERE id = ?", (i % rows,)).fetchone()),
+        ("fn", empty),
+        ("traced fn", traced_empty),
+        ("span", lambda i: tracing.span("bench", "span").__enter__().__exit__(None, None, None)),
+    ]
+
+    print(f"{'case':>16} {'off us':>8} {'on us':>8}")
+    results = {}
+    for enabled in (False, True):
+        tracing.set_enabled(enabled)
+        # fewer calls with tracing on: every one of them writes a line
+        calls = args.calls if not enabled else max(1, args.calls // 10)
+        for label, fn in cases:
+            per_call_us(fn, min(calls, 1000))
+            results.setdefault(label, []).append(per_call_us(fn, calls))
+    tracing.set_enabled(False)
+    for label, (off, on) in results.items():
+        print(f"{label:>16} {off:>8.2f} {on:>8.2f}")
+    print(f"{os.path.getsize(tracing.TRACE_FILE) / 1024 / 1024:.1f} MB of spans written with tracing on")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compares TriggerMatcher against the original triggers x customers substring loop.
+
+    python benchmarks/bench_trigger_matcher.py [sizes...] [--triggers N]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trigger_matcher import TriggerMatcher
+
+ITEMS = ["Wooden Spoon", "Clay Plate", "Woven Mat", "Straw Basket", "Cane Lamp",
+         "Bamboo Stool", "Ceramic Vase", "Brass Diya", "Jute Bag", "Terracotta Pot",
+         "Madhubani Painting", "Block Print Saree", "Silk Scarf", "Marble Coaster"]
+CITIES = ["Delhi", "Mumbai", "Bangalore", "Jaipur", "Kolkata", "Chennai", "Pune"]
+
+
+def make_triggers(count, rng):
+    triggers = set()
+    words = [w for item in ITEMS for w in item.split()] + CITIES
+    while len(triggers) < count:
+        if rng.random() < 0.3:
+            triggers.add(rng.choice(words))
+        else:
+            triggers.add("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(4, 9))))
+    return triggers
+
+
+def make_blobs(count, rng):
+    for _ in range(count):
+        last_bought = rng.choice(ITEMS)
+        liked = ", ".join(rng.sample(ITEMS, 3))
+        address = f"{rng.choice(CITIES)}, India"
+        yield f"{last_bought} {liked} {address}".lower()
+
+
+def time_it(fn, blobs):
+    start = time.perf_counter()
+    matched = 0
+    for blob in blobs:
+        if fn(blob):
+            matched += 1
+    return time.perf_counter() - start, matched
+
+
+def main():
+    args = sys.argv[1:]
+    trigger_count = 300
+    if "--triggers" in args:
+        i = args.index("--triggers")
+        trigger_count = int(args[i + 1])
+        del args[i:i + 2]
+    sizes = [int(a) for a in args] or [10_000, 100_000, 1_000_000]
+
+    rng = random.Random(42)
+    triggers = make_triggers(trigger_count, rng)
+    start = time.perf_counter()
+    matcher = TriggerMatcher(triggers)
+    print(f"{len(triggers)} triggers, automaton built in {time.perf_counter() - start:.4f}s")
+
+    print(f"{'customers':>10} {'loop (s)':>10} {'matcher (s)':>12} {'speedup':>8}")
+    for size in sizes:
+        blobs = list(make_blobs(size, random.Random(size)))
+        loop_time, loop_hits = time_it(lambda b: [t for t in triggers if t.lower() in b], blobs)
+        ac_time, ac_hits = time_it(matcher.match, blobs)
+        assert loop_hits == ac_hits
+        print(f"{size:>10} {loop_time:>10.3f} {ac_time:>12.3f} {loop_time / ac_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
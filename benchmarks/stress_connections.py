@@ -0,0 +1,115 @@
+"""
+Stress test for the shared connection manager: many concurrent readers and
+writers on chat_history.db, compared with the old connect-per-operation style
+on a rollback-journal copy.
+
+    python benchmarks/stress_connections.py [--readers 16] [--writers 8] [--seconds 5]
+
+Runs in a temporary directory; the project databases are not touched.
+"""
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import connections
+from db import init_db
+from function_handler import init_chat_db, add_chat_message, fetch_chat_history
+
+CLIENTS = [f"Client {i}" for i in range(20)]
+
+
+def naive_write(name, i):
+    conn = sqlite3.connect("legacy_chat.db")
+    conn.execute("INSERT INTO chat_messages (client_id, ts, sender, message) VALUES (?, ?, ?, ?)",
+                 (name.lower().replace(" ", "_"), time.time(), "agent", f"message {i}"))
+    conn.commit()
+    conn.close()
+
+
+def naive_read(name):
+    conn = sqlite3.connect("legacy_chat.db")
+    rows = conn.execute("SELECT sender, message FROM chat_messages WHERE client_id = ? ORDER BY ts, id",
+                        (name.lower().replace(" ", "_"),)).fetchall()
+    conn.close()
+    return rows
+
+
+def run(label, write, read, readers, writers, seconds):
+    stop = time.monotonic() + seconds
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(kind, index):
+        local_ops, local_errors, local_lat = 0, 0, []
+        i = 0
+        while time.monotonic() < stop:
+            name = CLIENTS[(index + i) % len(CLIENTS)]
+            start = time.perf_counter()
+            try:
+                if kind == "writes":
+                    write(name, i)
+                else:
+                    read(name)
+                local_ops += 1
+                local_lat.append(time.perf_counter() - start)
+            except sqlite3.OperationalError as e:
+                if "database is locked" not in str(e):
+                    raise
+                local_errors += 1
+            i += 1
+        connections.close_connections()
+        with lock:
+            counts[kind] += local_ops
+            counts["errors"] += local_errors
+            latencies.extend(local_lat)
+
+    threads = [threading.Thread(target=worker, args=("reads", i)) for i in range(readers)]
+    threads += [threading.Thread(target=worker, args=("writes", i)) for i in range(writers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    print(f"{label:>10}: {counts['reads'] / seconds:9.0f} reads/s {counts['writes'] / seconds:8.0f} writes/s "
+          f"{counts['errors']:6d} locked errors  p99 {p99:7.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        init_db()
+        init_chat_db()
+        legacy = sqlite3.connect("legacy_chat.db")
+        legacy.execute("""
+            CREATE TABLE chat_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, client_id TEXT, ts REAL,
+                sender TEXT, message TEXT, image_ref INTEGER, image BLOB
+            )
+        """)
+        legacy.execute("CREATE INDEX idx_chat_messages_client_ts ON chat_messages (client_id, ts)")
+        legacy.commit()
+        legacy.close()
+
+        run("naive", naive_write, naive_read, args.readers, args.writers, args.seconds)
+        run("pooled", lambda name, i: add_chat_message(name, "agent", f"message {i}"), fetch_chat_history,
+            args.readers, args.writers, args.seconds)
+        connections.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+import os
+import json
+import asyncio
+import hashlib
+from itertools import chain
+from db import init_db, craft_matcher, CRAFT_MATCHER
+from connections import get_connection, transaction
+from color_features import color_features_json, color_triggers
+from customer_scan import scan_customers, customer_ranges, iter_customers, text_blob
+from customer_index import index_exists, match_customers
+from reason_generator import build_reason_prompt, generate_reasons
+from async_runtime import submit, openai_client
+from tracing import span
+
+TRIGGER_KEYS = ['type', 'style', 'color', 'material', 'estimated_size', 'handcrafted']
+SIMILARITY_TOP_K = 3
+# use the customers_fts index (python customer_index.py build) when it exists; off unless CUSTOMER_FTS=1
+USE_CUSTOMER_INDEX = os.getenv("CUSTOMER_FTS", "0") == "1"
+FALLBACK_PREFIX = "Matched craft triggers: "
+
+
+#create clients/refresh_state tables and bring older clients tables up to date
+def init_potential_clients_db():
+    with transaction("potential_clients", immediate=True) as conn:
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS clients (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                email TEXT,
+                reason TEXT
+            )
+        """)
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(clients)")}
+        if "customer_id" not in columns:
+            cursor.execute("ALTER TABLE clients ADD COLUMN customer_id INTEGER")
+        if "matched_triggers" not in columns:
+            cursor.execute("ALTER TABLE clients ADD COLUMN matched_triggers TEXT")
+        if "reason_pending" not in columns:
+            # 1 while `reason` is the placeholder written after reason generation failed
+            cursor.execute("ALTER TABLE clients ADD COLUMN reason_pending INTEGER NOT NULL DEFAULT 0")
+            cursor.execute("UPDATE clients SET reason_pending = 1 WHERE reason LIKE ?", (FALLBACK_PREFIX + "%",))
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_clients_pending ON clients (id) WHERE reason_pending = 1")
+
+        # older refreshes appended duplicates; keep the first row per client
+        cursor.execute("""
+            DELETE FROM clients WHERE id NOT IN (
+                SELECT MIN(id) FROM clients GROUP BY name, email
+            )
+        """)
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_clients_key ON clients (name, email)")
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS refresh_state (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                max_image_id INTEGER NOT NULL,
+                max_customer_id INTEGER NOT NULL,
+                trigger_hash TEXT NOT NULL,
+                triggers TEXT NOT NULL
+            )
+        """)
+        columns = {row[1] for row in cursor.execute("PRAGMA table_info(refresh_state)")}
+        if "matcher" not in columns:
+            cursor.execute("ALTER TABLE refresh_state ADD COLUMN matcher TEXT NOT NULL DEFAULT 'substring'")
+
+
+_refresh_db_ready = False
+
+#images and potential_clients tables, created and migrated once per process
+def refresh_connection():
+    global _refresh_db_ready
+    if not _refresh_db_ready:
+        init_db()
+        init_potential_clients_db()
+        _refresh_db_ready = True
+    return get_connection("potential_clients")
+
+
+async def generate_client_reasons(prompts, matched_triggers):
+    """
+    [(reason, reason_pending)] for `prompts`, generated on the shared loop
+    (async_runtime) with its pooled OpenAI client. A prompt that still fails
+    after retries gets a placeholder listing its triggers and reason_pending=1,
+    so the next refresh tries it again.
+    """
+    reasons = await asyncio.wrap_future(submit(generate_reasons(
+        prompts, client=openai_client().with_options(max_retries=0)
+    )))
+    return [(reason, 0) if reason is not None else (FALLBACK_PREFIX + ", ".join(triggers), 1)
+            for reason, triggers in zip(reasons, matched_triggers)]
+
+
+async def retry_pending_reasons(conn_out):
+    """Regenerates the placeholder reasons of earlier refreshes; returns the (name, email, reason) rows fixed."""
+    pending = conn_out.execute(
+        "SELECT id, name, email, customer_id, matched_triggers FROM clients WHERE reason_pending = 1"
+    ).fetchall()
+    if not pending:
+        return []
+    conn_in = get_connection("meesho")
+    customers = {}
+    customer_ids = sorted({customer_id for _, _, _, customer_id, _ in pending if customer_id is not None})
+    for start in range(0, len(customer_ids), 900):
+        batch = customer_ids[start:start + 900]
+        customers.update((row[0], row[1:]) for row in conn_in.execute(
+            f"SELECT id, address, last_bought_item, liked_products FROM customers WHERE id IN ({','.join('?' * len(batch))})",
+            batch
+        ))
+    # clients whose customer row is gone keep their placeholder
+    retry = [(client_id, name, email, json.loads(matched_json or "[]"), customers[customer_id])
+             for client_id, name, email, customer_id, matched_json in pending if customer_id in customers]
+    if not retry:
+        return []
+
+    print(f"Retrying {len(retry)} placeholder reasons...")
+    with span("search", "retry_pending_reasons", clients=len(retry)):
+        results = await generate_client_reasons(
+            [build_reason_prompt(triggers, name, last_bought, liked, address)
+             for _, name, _, triggers, (address, last_bought, liked) in retry],
+            [triggers for _, _, _, triggers, _ in retry]
+        )
+    with transaction("potential_clients"):
+        conn_out.executemany(
+            "UPDATE clients SET reason = ?, reason_pending = ? WHERE id = ?",
+            [(reason, reason_pending, client_id) for (client_id, _, _, _, _), (reason, reason_pending) in zip(retry, results)]
+        )
+    return [(name, email, reason) for (_, name, email, _, _), (reason, reason_pending) in zip(retry, results)
+            if not reason_pending]
+
+
+def trigger_hash(triggers):
+    return hashlib.sha256(json.dumps(sorted(triggers)).encode("utf-8")).hexdigest()
+
+
+def load_watermark(conn):
+    row = conn.execute(
+        "SELECT max_image_id, max_customer_id, trigger_hash, triggers, matcher FROM refresh_state WHERE id = 1"
+    ).fetchone()
+    if not row:
+        return 0, 0, trigger_hash([]), set(), None
+    max_image_id, max_customer_id, stored_hash, triggers_json, matcher = row
+    return max_image_id, max_customer_id, stored_hash, set(json.loads(triggers_json)), matcher
+
+
+def save_watermark(conn, max_image_id, max_customer_id, triggers, matcher):
+    conn.execute("""
+        INSERT INTO refresh_state (id, max_image_id, max_customer_id, trigger_hash, triggers, matcher)
+        VALUES (1, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            max_image_id = excluded.max_image_id,
+            max_customer_id = excluded.max_customer_id,
+            trigger_hash = excluded.trigger_hash,
+            triggers = excluded.triggers,
+            matcher = excluded.matcher
+    """, (max_image_id, max_customer_id, trigger_hash(triggers), json.dumps(sorted(triggers)), matcher))
+
+
+def extract_triggers(metadata_str, color_features):
+    """Triggers contributed by one images row: metadata fields plus the dominant colour."""
+    triggers = set()
+    try:
+        metadata = json.loads(metadata_str)
+    except (json.JSONDecodeError, TypeError):
+        print("Invalid JSON in metadata.")
+        return triggers
+
+    for key in TRIGGER_KEYS:
+        value = metadata.get(key)
+        if value:
+            if isinstance(value, list):
+                triggers.update(str(v) for v in value)
+            else:
+                triggers.add(str(value))
+
+    if color_features:
+        triggers.update(color_triggers(json.loads(color_features)))
+    return triggers
+
+
+def _load_image_rows(conn_crafts, after_id):
+    """
+    (id, metadata, color_features) for images past `after_id`. Rows saved before
+    colour features existed are decoded once here and backfilled.
+    """
+    rows = conn_crafts.execute(
+        "SELECT id, metadata, color_features FROM images WHERE id > ? ORDER BY id", (after_id,)
+    ).fetchall()
+    backfill = []
+    for i, (image_id, metadata_str, color_features) in enumerate(rows):
+        if color_features is None:
+            (image_blob,) = conn_crafts.execute("SELECT image FROM images WHERE id = ?", (image_id,)).fetchone()
+            if image_blob:
+                color_features = color_features_json(image_blob)
+                if color_features:
+                    backfill.append((color_features, image_id))
+                    rows[i] = (image_id, metadata_str, color_features)
+    if backfill:
+        with transaction("images"):
+            conn_crafts.executemany("UPDATE images SET color_features = ? WHERE id = ?", backfill)
+        print(f"Backfilled colour features for {len(backfill)} images.")
+    return rows
+
+
+def _similarity_chunks(conn_crafts, after_id, up_to_id, previous_image_id, rescan):
+    """
+    Candidate chunks for the "tfidf" matcher: a customer matches the crafts
+    whose descriptions are among its SIMILARITY_TOP_K most similar ones, and its
+    matched triggers are those crafts' triggers. Existing customers are only
+    rescanned when `rescan` (new crafts) and kept if a new craft is among their matches.
+    """
+    image_ids, matcher = craft_matcher()
+    craft_triggers = {
+        image_id: extract_triggers(metadata_str, color_features)
+        for image_id, metadata_str, color_features in conn_crafts.execute("SELECT id, metadata, color_features FROM images")
+    }
+    conn_clients = get_connection("meesho")
+
+    def scan(low, high, only_new_crafts):
+        for bounds in customer_ranges(conn_clients, low, high):
+            customers = list(iter_customers(conn_clients, *bounds))
+            if not customers:
+                yield bounds, []
+                continue
+            (indices, _), = matcher.iter_top_k(
+                [text_blob(address, last_bought, liked) for _, _, address, last_bought, liked, _ in customers],
+                k=SIMILARITY_TOP_K, chunk_size=len(customers)
+            )
+            candidates = []
+            for (id_, name, address, last_bought, liked, email), row in zip(customers, indices.tolist()):
+                matched_ids = [image_ids[i] for i in row if i >= 0]
+                if not matched_ids or (only_new_crafts and max(matched_ids) <= previous_image_id):
+                    continue
+                matched_triggers = sorted(set().union(*(craft_triggers.get(i, ()) for i in matched_ids)))
+                if matched_triggers:
+                    candidates.append((id_, name, email, address, last_bought, liked, matched_triggers))
+            yield bounds, candidates
+
+    if rescan and after_id:
+        yield from scan(0, after_id, True)
+    yield from scan(after_id, up_to_id, False)
+
+
+async def refresh_potential_clients(full_refresh=False, matcher=None, on_progress=None):
+    """
+    Matches customers in meesho.db against craft triggers from images.db and
+    upserts the matches into potential_clients.db. `matcher` is "substring"
+    (triggers contained in the customer text) or "tfidf" (most similar craft
+    descriptions, see _similarity_chunks); it defaults to CRAFT_MATCHER.
+
+    Incremental by default: only images and customers added since the stored
+    watermark are read. New customers are matched against every trigger, and
+    existing customers only against triggers that are new since the last
+    refresh. A reason is generated only when a client is new or their matched
+    trigger list changed. Clients whose reason could not be generated keep a
+    placeholder with reason_pending set, and every refresh first retries
+    those. Returns the (name, email, reason) rows written.
+
+    Customers are streamed in id-range chunks (see customer_scan), or looked
+    up through the customers_fts index when it has been built and
+    CUSTOMER_FTS=1 (see customer_index). Each chunk's matches are reasoned about and upserted
+    before the next is read, so memory does not grow with meesho.db.
+    Reasons are generated on the shared event loop (async_runtime) with its
+    pooled OpenAI client, so refreshes reuse the agent's connections.
+
+    on_progress(dict) is called after every chunk with running counts
+    (customers_scanned of customers_total, candidates, reasons_generated,
+    clients_upserted). An exception raised from it stops the refresh; chunks
+    already upserted stay, and the next refresh picks up from the old watermark
+    without regenerating their reasons.
+    """
+    conn_out = refresh_connection()
+    retried = await retry_pending_reasons(conn_out)
+    matcher_kind = matcher or CRAFT_MATCHER
+    max_image_id, max_customer_id, stored_hash, known_triggers, stored_matcher = load_watermark(conn_out)
+
+    conn_crafts = get_connection("images")
+    current_max_image_id = conn_crafts.execute("SELECT COALESCE(MAX(id), 0) FROM images").fetchone()[0]
+    if full_refresh or current_max_image_id < max_image_id or stored_matcher not in (None, matcher_kind):
+        # first run, forced, images were removed or the matcher changed: start over
+        max_image_id, max_customer_id, known_triggers = 0, 0, set()
+    previous_image_id = max_image_id
+
+    print("Connecting to images.db...")
+    rows = _load_image_rows(conn_crafts, max_image_id)
+    print(f"Loaded {len(rows)} new image rows.")
+
+    triggers = set(known_triggers)
+    for image_id, metadata_str, color_features in rows:
+        triggers.update(extract_triggers(metadata_str, color_features))
+        max_image_id = max(max_image_id, image_id)
+    new_triggers = triggers - known_triggers
+    print(f"{len(triggers)} triggers, {len(new_triggers)} new.")
+
+    print("Connecting to meesho.db...")
+    last_customer_id = get_connection("meesho").execute("SELECT COALESCE(MAX(id), 0) FROM customers").fetchone()[0]
+    if last_customer_id <= max_customer_id and trigger_hash(triggers) == stored_hash:
+        save_watermark(conn_out, max_image_id, max_customer_id, triggers, matcher_kind)
+        print("No new triggers or clients since last refresh.")
+        return retried
+
+    # existing customers only matter again if new crafts (tfidf) or new triggers could match them
+    rescan = bool(max_customer_id) and bool(rows if matcher_kind == "tfidf" else new_triggers)
+    if matcher_kind == "tfidf":
+        chunks = _similarity_chunks(conn_crafts, max_customer_id, last_customer_id, previous_image_id, rescan)
+    else:
+        # the index returns only customers containing a trigger; otherwise every row is scanned
+        scan = match_customers if USE_CUSTOMER_INDEX and index_exists() else scan_customers
+        chunks = scan(triggers, max_customer_id, last_customer_id)
+        if rescan:
+            chunks = chain(scan(triggers, 0, max_customer_id, new_triggers=new_triggers), chunks)
+
+    existing = {
+        (name, email): matched_json
+        for name, email, matched_json in conn_out.execute("SELECT name, email, matched_triggers FROM clients")
+    }
+    written = list(retried)
+    progress = {"customers_scanned": 0, "customers_total": last_customer_id - (0 if rescan else max_customer_id), "candidates": 0,
+                "reasons_generated": 0, "clients_upserted": 0}
+    if on_progress:
+        on_progress(dict(progress))
+    for (low, high), candidates in chunks:
+        progress["customers_scanned"] += high - low
+        progress["candidates"] += len(candidates)
+        matches = []
+        for id_, name, email, address, last_bought, liked, matched_triggers in candidates:
+            key = (name, email if email else "NA")
+            matched_json = json.dumps(sorted(matched_triggers))
+            if existing.get(key) == matched_json:
+                continue
+            existing[key] = matched_json
+            matches.append((id_, key, matched_json, matched_triggers,
+                            build_reason_prompt(matched_triggers, name, last_bought, liked, address)))
+        if not matches:
+            if on_progress:
+                on_progress(dict(progress))
+            continue
+
+        print(f"Generating reasons for {len(matches)} matches...")
+        with span("search", "generate_reasons", matches=len(matches)):
+            # the OpenAI calls run on the shared loop with its pooled client; the scan stays on this thread
+            reasons = await generate_client_reasons([m[4] for m in matches], [m[3] for m in matches])
+        matched_clients = [
+            (name, email, reason, id_, matched_json, reason_pending)
+            for (id_, (name, email), matched_json, _, _), (reason, reason_pending) in zip(matches, reasons)
+        ]
+        with transaction("potential_clients"):
+            conn_out.executemany("""
+                INSERT INTO clients (name, email, reason, customer_id, matched_triggers, reason_pending)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(name, email) DO UPDATE SET
+                    reason = excluded.reason,
+                    customer_id = excluded.customer_id,
+                    matched_triggers = excluded.matched_triggers,
+                    reason_pending = excluded.reason_pending
+            """, matched_clients)
+        written.extend((name, email, reason) for name, email, reason, _, _, _ in matched_clients)
+        progress["reasons_generated"] += len(matches)
+        progress["clients_upserted"] = len(written)
+        if on_progress:
+            on_progress(dict(progress))
+
+    print(f"Scanned clients up to id {last_customer_id}, {progress['candidates']} candidates.")
+    save_watermark(conn_out, max_image_id, max(max_customer_id, last_customer_id), triggers, matcher_kind)
+    print(f"{len(written)} clients upserted.")
+    return written
@@ -0,0 +1,65 @@
+import io
+import json
+from tracing import traced
+
+THUMBNAIL_SIZE = 128
+LEVELS = 8
+TOP_K = 3
+
+
+@traced("image")
+def extract_color_features(image_bytes, thumbnail_size=THUMBNAIL_SIZE, levels=LEVELS, top_k=TOP_K):
+    """
+    Colour summary of an image computed on a downscaled thumbnail.
+
+    Each channel is quantized into `levels` bins, giving a levels**3 bin
+    histogram (normalized to fractions). `dominant_colors` holds the top_k
+    bins as the mean RGB of their pixels plus the share of the image they cover.
+    """
+    # imported here so numpy and PIL only load once an image is processed, not at app start
+    import numpy as np
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes))
+    # lets the JPEG decoder skip most of the full-resolution work
+    image.draft("RGB", (thumbnail_size, thumbnail_size))
+    image = image.convert("RGB")
+    image.thumbnail((thumbnail_size, thumbnail_size))
+
+    pixels = np.asarray(image, dtype=np.uint8).reshape(-1, 3)
+    step = 256 // levels
+    quantized = (pixels // step).astype(np.int64)
+    bins = (quantized[:, 0] * levels + quantized[:, 1]) * levels + quantized[:, 2]
+
+    n_bins = levels ** 3
+    counts = np.bincount(bins, minlength=n_bins)
+    sums = np.stack([np.bincount(bins, weights=pixels[:, c], minlength=n_bins) for c in range(3)], axis=1)
+
+    top = np.argsort(counts)[::-1][:top_k]
+    top = top[counts[top] > 0]
+    total = counts.sum()
+    dominant_colors = [
+        {
+            "rgb": [int(round(v)) for v in sums[b] / counts[b]],
+            "fraction": round(float(counts[b] / total), 4)
+        }
+        for b in top
+    ]
+    return {
+        "levels": levels,
+        "histogram": [round(float(v), 5) for v in counts / total],
+        "dominant_colors": dominant_colors
+    }
+
+
+def color_features_json(image_bytes):
+    try:
+        return json.dumps(extract_color_features(image_bytes))
+    except Exception as e:
+        print(f"Color feature error: {e}")
+        return None
+
+
+def color_triggers(features):
+    """Triggers in the same rgb(r, g, b) form search_client has always used."""
+    return {f"rgb{tuple(color['rgb'])}" for color in features.get("dominant_colors", [])[:1]}
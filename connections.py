@@ -0,0 +1,141 @@
+"""
+Shared SQLite connections for the app's databases.
+
+Each thread gets one long-lived connection per database, opened in autocommit
+mode with WAL journaling and the pragmas below. Multi-statement writes go
+through `transaction()`, so a pooled connection never holds a write lock
+between calls. Statements run on pooled connections are timed as "db" spans
+while tracing is on (tracing.py).
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+import tracing
+
+DATABASES = {
+    "images": "images.db",
+    "meesho": "meesho.db",
+    "potential_clients": "potential_clients.db",
+    "chat_history": "chat_history.db",
+    "llm_cache": "llm_cache.db",
+}
+
+BUSY_TIMEOUT_MS = 10000
+MMAP_SIZE = 256 * 1024 * 1024
+CACHED_STATEMENTS = 256
+
+_local = threading.local()
+_wal_ready = set()
+_wal_lock = threading.Lock()
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+class TracedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        if not tracing.enabled:
+            return super().execute(sql, parameters)
+        with tracing.span("db", self.connection.db, sql=tracing.sql_preview(sql)):
+            return super().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not tracing.enabled:
+            return super().executemany(sql, seq_of_parameters)
+        with tracing.span("db", self.connection.db, sql=tracing.sql_preview(sql), many=True):
+            return super().executemany(sql, seq_of_parameters)
+
+
+class TracedConnection(sqlite3.Connection):
+    """sqlite3.Connection whose statements are timed while tracing is on; `db` names the span."""
+    db = "sqlite"
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if not tracing.enabled:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not tracing.enabled:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def _open(db):
+    path = DATABASES[db]
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None,
+                           cached_statements=CACHED_STATEMENTS, factory=TracedConnection)
+    conn.db = db
+    # journal_mode is stored in the file, so it only needs setting once per process
+    with _wal_lock:
+        if os.path.abspath(path) not in _wal_ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            _wal_ready.add(os.path.abspath(path))
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    return conn
+
+
+def get_connection(db):
+    """This thread's pooled connection to `db` (a key of DATABASES)."""
+    pool = getattr(_local, "pool", None)
+    if pool is None:
+        pool = _local.pool = {}
+    conn = pool.get(db)
+    if conn is None:
+        conn = pool[db] = _open(db)
+    return conn
+
+
+@contextmanager
+def transaction(db, immediate=False):
+    """
+    Runs the block in one transaction on the pooled connection. Use
+    immediate=True for read-then-write blocks so the write lock is taken up front.
+    """
+    conn = get_connection(db)
+    if conn.in_transaction:
+        # nested use joins the outer transaction
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.rollback()
+        raise
+    else:
+        conn.commit()
+
+
+def attach(conn, alias, db):
+    """Attaches another database to `conn` under `alias`, once."""
+    attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+    if alias not in attached:
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (DATABASES[db],))
+
+
+def data_version(db):
+    """
+    A number that changes whenever any connection, in this process or another,
+    commits to `db`. A connection's own commits don't change its data_version,
+    so this reads it on a shared connection that never writes. In WAL mode it
+    is a shared-memory read.
+    """
+    with _watchers_lock:
+        conn = _watchers.get(db)
+        if conn is None:
+            conn = _watchers[db] = sqlite3.connect(DATABASES[db], isolation_level=None, check_same_thread=False)
+        return conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def close_connections():
+    """Closes this thread's pooled connections."""
+    pool = getattr(_local, "pool", None) or {}
+    for conn in pool.values():
+        conn.close()
+    pool.clear()
@@ -0,0 +1,171 @@
+"""
+FTS5 trigram index over meesho.db customers, so trigger lookups run in SQL.
+
+The index (customers_fts) is a contentless FTS5 table with one column holding
+each customer's text blob, built like customer_scan.text_blob (the same
+fields, separators and lowercasing), and kept in sync with customers by SQLite
+triggers. With the trigram tokenizer a quoted MATCH phrase is a case-folded
+substring test, so it finds every customer the full scan would; the rows it
+returns are then checked with the same TriggerMatcher, so both paths return
+the same matches. Triggers the index cannot answer exactly (shorter than three
+characters, or non-ASCII, where SQLite and Python case-fold differently) send
+the lookup to the full scan instead.
+
+Build it once (it is not created automatically, since it lives in the
+customer database and can be large):
+
+    python customer_index.py build      # create if missing
+    python customer_index.py rebuild    # repopulate from customers
+    python customer_index.py drop
+"""
+import os
+import time
+import argparse
+from connections import get_connection, transaction
+from customer_scan import CUSTOMER_COLUMNS, text_blob, scan_customers
+from trigger_matcher import TriggerMatcher
+
+FTS_TABLE = "customers_fts"
+FTS_COLUMN = "blob"
+TRIGGER_BATCH = int(os.getenv("CUSTOMER_FTS_TRIGGER_BATCH", "100"))
+FETCH_BATCH = 900
+# trigram phrases need at least three characters
+MIN_TRIGRAM = 3
+
+
+def _blob_sql(row):
+    """SQL for text_blob(address, last_bought, liked) over `row` (new, old or customers)."""
+    return (f"lower(COALESCE({row}.last_bought_item, '') || ' ' || COALESCE({row}.liked_products, '') "
+            f"|| ' ' || COALESCE({row}.address, ''))")
+
+
+def index_exists(conn=None):
+    """True when customers_fts exists with the current single-column layout."""
+    conn = conn or get_connection("meesho")
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({FTS_TABLE})")] == [FTS_COLUMN]
+
+
+def indexable(trigger):
+    """Whether a MATCH on the index finds every blob containing `trigger`."""
+    return len(trigger) >= MIN_TRIGRAM and trigger.isascii()
+
+
+def build_index(rebuild=False):
+    """Creates customers_fts and its sync triggers; fills it when new or when rebuild=True."""
+    if not index_exists() and get_connection("meesho").execute(
+        "SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE,)
+    ).fetchone():
+        # an index from before the single blob column
+        drop_index()
+    with transaction("meesho", immediate=True) as conn:
+        created = not index_exists(conn)
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+                {FTS_COLUMN}, content='', tokenize='trigram'
+            )
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON customers BEGIN
+                INSERT INTO {FTS_TABLE} (rowid, {FTS_COLUMN}) VALUES (new.id, {_blob_sql("new")});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON customers BEGIN
+                INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {FTS_COLUMN}) VALUES ('delete', old.id, {_blob_sql("old")});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE ON customers BEGIN
+                INSERT INTO {FTS_TABLE} ({FTS_TABLE}, rowid, {FTS_COLUMN}) VALUES ('delete', old.id, {_blob_sql("old")});
+                INSERT INTO {FTS_TABLE} (rowid, {FTS_COLUMN}) VALUES (new.id, {_blob_sql("new")});
+            END
+        """)
+        if created or rebuild:
+            # a contentless table has nothing to 'rebuild' from, so it is refilled from customers
+            conn.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('delete-all')")
+            conn.execute(f"INSERT INTO {FTS_TABLE} (rowid, {FTS_COLUMN}) SELECT id, {_blob_sql('customers')} FROM customers")
+            conn.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+
+
+def drop_index():
+    with transaction("meesho", immediate=True) as conn:
+        for suffix in ("ai", "ad", "au"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}")
+        conn.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def _phrase(trigger):
+    return '"' + trigger.replace('"', '""') + '"'
+
+
+def candidate_ids(triggers, after_id, up_to_id):
+    """
+    Sorted ids of customers (after_id < id <= up_to_id) whose blob contains any
+    of `triggers`, one MATCH per TRIGGER_BATCH triggers. Every trigger must be
+    indexable(); the ids may include a few customers TriggerMatcher rejects.
+    """
+    conn = get_connection("meesho")
+    triggers = sorted(set(triggers))
+    ids = set()
+    for start in range(0, len(triggers), TRIGGER_BATCH):
+        query = " OR ".join(_phrase(trigger) for trigger in triggers[start:start + TRIGGER_BATCH])
+        ids.update(row[0] for row in conn.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH ? AND rowid > ? AND rowid <= ?",
+            (query, after_id, up_to_id)
+        ))
+    return sorted(ids)
+
+
+def match_customers(triggers, after_id, up_to_id, new_triggers=None, chunk_size=FETCH_BATCH * 20):
+    """
+    Same ((low, high], candidates) chunks as customer_scan.scan_customers, from the index: candidate ids
+    come from MATCH queries (on new_triggers only in a rescan), and only those
+    rows are read and run through the trigger matchers the scan uses. Falls
+    back to scan_customers when a trigger it would look up is not indexable().
+    """
+    lookup = list(new_triggers if new_triggers is not None else triggers)
+    if not all(indexable(trigger) for trigger in lookup):
+        yield from scan_customers(triggers, after_id, up_to_id, new_triggers=new_triggers)
+        return
+    matcher = TriggerMatcher(triggers)
+    new_matcher = TriggerMatcher(new_triggers) if new_triggers is not None else None
+    ids = candidate_ids(lookup, after_id, up_to_id)
+    conn = get_connection("meesho")
+    low = after_id
+    for start in range(0, len(ids), chunk_size):
+        candidates = []
+        chunk_ids = ids[start:start + chunk_size]
+        for batch_start in range(0, len(chunk_ids), FETCH_BATCH):
+            batch = chunk_ids[batch_start:batch_start + FETCH_BATCH]
+            rows = conn.execute(
+                f"SELECT {CUSTOMER_COLUMNS} FROM customers WHERE id IN ({','.join('?' * len(batch))}) ORDER BY id", batch
+            ).fetchall()
+            for id_, name, address, last_bought, liked, email in rows:
+                blob = text_blob(address, last_bought, liked)
+                if new_matcher is not None and not new_matcher.match_indices(blob):
+                    continue
+                matched_triggers = matcher.match(blob)
+                if matched_triggers:
+                    candidates.append((id_, name, email, address, last_bought, liked, matched_triggers))
+        high = up_to_id if start + chunk_size >= len(ids) else chunk_ids[-1]
+        yield (low, high), candidates
+        low = high
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the customers_fts index in meesho.db.")
+    parser.add_argument("command", choices=["build", "rebuild", "drop"])
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "drop":
+        drop_index()
+        print(f"Dropped {FTS_TABLE}.")
+        return
+    build_index(rebuild=args.command == "rebuild")
+    count = get_connection("meesho").execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+    print(f"{FTS_TABLE} ready over {count} customers in {time.perf_counter() - start:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Streaming scan of meesho.db customers for craft trigger matches.
+
+Customers are read in id-range chunks, so memory stays flat however large the
+table is. When a scan spans more than one chunk, the chunks are fanned out to a
+process pool; each worker reads its own range and runs the Aho-Corasick
+matcher, and only the matching customers travel back to the caller, in id order.
+"""
+import os
+import sqlite3
+import multiprocessing
+from itertools import chain
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from connections import DATABASES, BUSY_TIMEOUT_MS, get_connection
+from trigger_matcher import TriggerMatcher
+from tracing import traced
+
+SCAN_CHUNK = int(os.getenv("CUSTOMER_SCAN_CHUNK", "20000"))
+SCAN_WORKERS = int(os.getenv("CUSTOMER_SCAN_WORKERS", str(os.cpu_count() or 1)))
+FETCH_SIZE = 2000
+
+CUSTOMER_COLUMNS = "id, name, address, last_bought_item, liked_products, email"
+
+
+def text_blob(address, last_bought, liked):
+    return f"{(last_bought or '')} {(liked or '')} {(address or '')}".lower()
+
+
+def customer_ranges(conn, after_id, up_to_id, chunk_size=None):
+    """
+    (low, high] id bounds covering after_id < id <= up_to_id, chunk_size ids
+    each. Ids are the rowid, so the bounds cost nothing to compute; ranges that
+    fall in a gap of deleted ids are skipped.
+    """
+    chunk_size = chunk_size or SCAN_CHUNK
+    low = after_id
+    while low < up_to_id:
+        first_id = conn.execute("SELECT MIN(id) FROM customers WHERE id > ? AND id <= ?", (low, up_to_id)).fetchone()[0]
+        if first_id is None:
+            return
+        low = max(low, first_id - 1)
+        high = min(low + chunk_size, up_to_id)
+        yield low, high
+        low = high
+
+
+def iter_customers(conn, low, high):
+    """Customer rows with low < id <= high, fetched FETCH_SIZE at a time."""
+    cursor = conn.execute(
+        f"SELECT {CUSTOMER_COLUMNS} FROM customers WHERE id > ? AND id <= ? ORDER BY id", (low, high)
+    )
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+
+_worker = {}
+
+
+def _init_worker(triggers, new_triggers):
+    _worker["matcher"] = TriggerMatcher(triggers)
+    _worker["new_matcher"] = TriggerMatcher(new_triggers) if new_triggers is not None else None
+    # read-only scans need none of the pooled connection's pragmas
+    _worker["conn"] = sqlite3.connect(DATABASES["meesho"], timeout=BUSY_TIMEOUT_MS / 1000)
+
+
+@traced("scan")
+def _scan_range(conn, bounds, matcher, new_matcher):
+    """
+    (id, name, email, address, last_bought, liked, matched_triggers) for the
+    customers in `bounds` that match. In a rescan (new_matcher given) only
+    customers matching a new trigger are returned, with all their matches.
+    """
+    candidates = []
+    for id_, name, address, last_bought, liked, email in iter_customers(conn, *bounds):
+        blob = text_blob(address, last_bought, liked)
+        if new_matcher is not None and not new_matcher.match_indices(blob):
+            continue
+        matched_triggers = matcher.match(blob)
+        if matched_triggers:
+            candidates.append((id_, name, email, address, last_bought, liked, matched_triggers))
+    return candidates
+
+
+def _match_range(bounds):
+    return _scan_range(_worker["conn"], bounds, _worker["matcher"], _worker["new_matcher"])
+
+
+def scan_customers(triggers, after_id, up_to_id, new_triggers=None, chunk_size=None, workers=None):
+    """
+    Yields ((low, high], matching customers) per id-range chunk, in id order.
+
+    Scans that fit in one chunk, or workers=1, run in this process; otherwise
+    up to `workers` processes match chunks in parallel, with at most two chunks
+    per worker queued so results never pile up ahead of the consumer.
+    """
+    triggers = list(triggers)
+    new_triggers = list(new_triggers) if new_triggers is not None else None
+    workers = workers or SCAN_WORKERS
+    ranges = customer_ranges(get_connection("meesho"), after_id, up_to_id, chunk_size)
+    first = next(ranges, None)
+    if first is None:
+        return
+    second = next(ranges, None)
+
+    if second is None or workers <= 1:
+        matcher = TriggerMatcher(triggers)
+        new_matcher = TriggerMatcher(new_triggers) if new_triggers is not None else None
+        conn = get_connection("meesho")
+        for bounds in chain([first], [second] if second else [], ranges):
+            yield bounds, _scan_range(conn, bounds, matcher, new_matcher)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                             initargs=(triggers, new_triggers)) as pool:
+        pending = deque((bounds, pool.submit(_match_range, bounds)) for bounds in (first, second))
+        for bounds in ranges:
+            if len(pending) >= workers * 2:
+                done_bounds, future = pending.popleft()
+                yield done_bounds, future.result()
+            pending.append((bounds, pool.submit(_match_range, bounds)))
+        while pending:
+            done_bounds, future = pending.popleft()
+            yield done_bounds, future.result()
@@ -1,34 +1,255 @@
-import sqlite3
+import os
 import json
+import hashlib
+import threading
+from color_features import color_features_json
+from thumbnails import thumbnail_or_none
+from connections import get_connection, transaction
+
+CRAFT_FIELDS = ["type", "style", "color", "material", "estimated_size", "handcrafted"]
+#fields that describe what a craft is; size and handcrafted only add noise to similarity
+SIMILARITY_FIELDS = ["type", "style", "color", "material"]
+#"substring" (exact trigger containment) or "tfidf" (character n-gram similarity)
+CRAFT_MATCHER = os.getenv("CRAFT_MATCHER", "substring")
 
 #initialize db and create table if it doesn,t exist
 def init_db():
-    conn = sqlite3.connect("images.db")
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS images(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            image BLOB,
-            metadata TEXT
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-#save image to db
+    with transaction("images", immediate=True) as conn:
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS images(
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT,
+                image BLOB,
+                metadata TEXT
+            )
+        ''')
+        columns = {row[1] for row in c.execute("PRAGMA table_info(images)")}
+        if "color_features" not in columns:
+            c.execute("ALTER TABLE images ADD COLUMN color_features TEXT")
+        if "image_hash" not in columns:
+            c.execute("ALTER TABLE images ADD COLUMN image_hash TEXT")
+        c.execute("SELECT id, image FROM images WHERE image_hash IS NULL AND image IS NOT NULL")
+        c.executemany("UPDATE images SET image_hash = ? WHERE id = ?", [(image_hash(blob), image_id) for image_id, blob in c.fetchall()])
+        c.execute("CREATE INDEX IF NOT EXISTS idx_images_hash ON images (image_hash)")
+
+        # small JPEG previews for the gallery, kept apart from the original BLOBs
+        # (thumbnail is NULL when the original could not be decoded)
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS thumbnails(
+                image_id INTEGER PRIMARY KEY REFERENCES images(id),
+                thumbnail BLOB
+            )
+        ''')
+
+        # parsed craft fields, so lookups never touch the image BLOBs
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS crafts(
+                image_id INTEGER PRIMARY KEY REFERENCES images(id),
+                type TEXT,
+                style TEXT,
+                color TEXT,
+                material TEXT,
+                estimated_size TEXT,
+                handcrafted TEXT
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS craft_tokens(
+                token TEXT,
+                image_id INTEGER,
+                PRIMARY KEY (token, image_id)
+            ) WITHOUT ROWID
+        ''')
+        c.execute("SELECT id, metadata FROM images WHERE id NOT IN (SELECT image_id FROM crafts)")
+        for image_id, metadata in c.fetchall():
+            try:
+                metadata_dict = json.loads(metadata) if metadata else {}
+            except json.JSONDecodeError:
+                metadata_dict = {}
+            _index_craft(c, image_id, metadata_dict)
+
+def _craft_values(metadata_dict):
+    if not isinstance(metadata_dict, dict):
+        metadata_dict = {}
+    return [str(metadata_dict[key]) if key in metadata_dict else None for key in CRAFT_FIELDS]
+
+#same tokens image_sender_tool has always scored on: whitespace split, lowercased
+def craft_tokens(values):
+    return {word.lower() for value in values if value for word in value.split()}
+
+def _index_craft(c, image_id, metadata_dict):
+    values = _craft_values(metadata_dict)
+    c.execute("INSERT OR REPLACE INTO crafts (image_id, type, style, color, material, estimated_size, handcrafted) VALUES (?,?,?,?,?,?,?)", (image_id, *values))
+    c.executemany("INSERT OR IGNORE INTO craft_tokens (token, image_id) VALUES (?, ?)", [(token, image_id) for token in craft_tokens(values)])
+
+def image_hash(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+#id of an already stored copy of these bytes, if any
+def find_image_by_hash(content_hash):
+    row = get_connection("images").execute("SELECT id FROM images WHERE image_hash = ? ORDER BY id LIMIT 1", (content_hash,)).fetchone()
+    return row[0] if row else None
+
+#save image to db, along with its colour features and thumbnail so nothing decodes it again
+#identical bytes are stored once; returns the id of the stored (or existing) row
 def save_image_with_metadata(name , image_bytes , metadata_dict):
-    conn = sqlite3.connect("images.db")
-    c = conn.cursor()
-    c.execute("INSERT INTO images (name , image , metadata) VALUES(?,? ,?)" ,(name ,image_bytes , json.dumps(metadata_dict)))
-    conn.commit()
-    conn.close()
-
-#get all saved images():
-def get_images_with_metadata():
-    conn = sqlite3.connect("images.db")
-    c = conn.cursor()
-    c.execute("SELECT name, image, metadata FROM images")
-    rows = c.fetchall()
-    conn.close()
-    return [(name , img_blob , json.loads(metadata)) for name, img_blob , metadata in rows]
\ No newline at end of file
+    existing_id = find_image_by_hash(image_hash(image_bytes))
+    if existing_id is not None:
+        return existing_id
+    return save_images_batch([(name, image_bytes, metadata_dict, color_features_json(image_bytes), thumbnail_or_none(image_bytes))])[0]
+
+#save many (name, image_bytes, metadata_dict, color_features_json, thumbnail) entries in one transaction
+#returns one image id per entry; bytes already stored (or repeated in the batch) map to the existing row
+def save_images_batch(entries):
+    hashes = [image_hash(image_bytes) for _, image_bytes, _, _, _ in entries]
+    with transaction("images", immediate=True) as conn:
+        return _save_images_batch(conn.cursor(), entries, hashes)
+
+def _save_images_batch(c, entries, hashes):
+    ids = {}
+    for content_hash in set(hashes):
+        c.execute("SELECT id FROM images WHERE image_hash = ? ORDER BY id LIMIT 1", (content_hash,))
+        row = c.fetchone()
+        if row:
+            ids[content_hash] = row[0]
+
+    new_entries = []
+    for content_hash, (name, image_bytes, metadata_dict, color_features, thumbnail) in zip(hashes, entries):
+        if content_hash not in ids:
+            ids[content_hash] = None
+            new_entries.append((content_hash, name, image_bytes, metadata_dict, color_features, thumbnail))
+
+    c.executemany("INSERT INTO images (name , image , metadata , color_features , image_hash) VALUES(?,? ,? ,? ,?)",
+                  [(name, image_bytes, json.dumps(metadata_dict), color_features, content_hash)
+                   for content_hash, name, image_bytes, metadata_dict, color_features, _ in new_entries])
+    for content_hash, _, _, metadata_dict, _, thumbnail in new_entries:
+        c.execute("SELECT id FROM images WHERE image_hash = ? ORDER BY id LIMIT 1", (content_hash,))
+        ids[content_hash] = c.fetchone()[0]
+        _index_craft(c, ids[content_hash], metadata_dict)
+        c.execute("INSERT OR REPLACE INTO thumbnails (image_id, thumbnail) VALUES (?, ?)", (ids[content_hash], thumbnail))
+    return [ids[content_hash] for content_hash in hashes]
+
+def count_images():
+    return get_connection("images").execute("SELECT COUNT(*) FROM images").fetchone()[0]
+
+#one gallery page of (image_id, name, thumbnail) without reading any original BLOB or metadata
+#images saved before thumbnails existed get theirs made here, a page at a time
+def get_gallery_page(offset, limit):
+    conn = get_connection("images")
+    rows = conn.execute('''
+        SELECT images.id, images.name, thumbnails.image_id IS NOT NULL, thumbnails.thumbnail
+        FROM images LEFT JOIN thumbnails ON thumbnails.image_id = images.id
+        ORDER BY images.id LIMIT ? OFFSET ?
+    ''', (limit, offset)).fetchall()
+    missing = {image_id: thumbnail_or_none(get_image_blob(image_id)) for image_id, _, has_thumbnail, _ in rows if not has_thumbnail}
+    if missing:
+        with transaction("images", immediate=True) as conn:
+            conn.executemany("INSERT OR REPLACE INTO thumbnails (image_id, thumbnail) VALUES (?, ?)", missing.items())
+    return [(image_id, name, missing.get(image_id, thumbnail)) for image_id, name, _, thumbnail in rows]
+
+def _craft_dict(row):
+    return {key: value for key, value in zip(CRAFT_FIELDS, row) if value is not None}
+
+#craft with the most indexed tokens in common with `tokens`; ties go to the oldest craft
+def best_craft_by_tokens(tokens):
+    tokens = list(tokens)
+    if not tokens:
+        return None
+    c = get_connection("images").cursor()
+    c.execute(f'''
+        SELECT image_id FROM craft_tokens
+        WHERE token IN ({",".join("?" * len(tokens))})
+        GROUP BY image_id
+        ORDER BY COUNT(*) DESC, image_id
+        LIMIT 1
+    ''', tokens)
+    row = c.fetchone()
+    return row[0] if row else None
+
+#words longer than this are not split into substrings; such a text scores every craft instead
+MAX_SUBSTRING_WORD = 64
+
+def _text_substrings(text_lower):
+    """Every substring of every whitespace-separated word of `text_lower`, or None if a word is too long."""
+    substrings = set()
+    for word in set(text_lower.split()):
+        if len(word) > MAX_SUBSTRING_WORD:
+            return None
+        substrings.update(word[i:j] for i in range(len(word)) for j in range(i + 1, len(word) + 1))
+    return substrings
+
+#craft whose field values appear most often in `text` (substring match, so 'wood' counts in 'wooden'); ties go to the oldest craft
+#a value can only be in the text if each of its tokens is inside one of the text's words, so the candidates are
+#the crafts with a token among those words' substrings, found through craft_tokens; only they are scored
+def best_craft_for_text(text):
+    text_lower = (text or "").lower()
+    if not text_lower:
+        return None
+    substrings = _text_substrings(text_lower)
+    c = get_connection("images").cursor()
+    if substrings is None:
+        c.execute("SELECT image_id, type, style, color, material, estimated_size, handcrafted FROM crafts ORDER BY image_id")
+    else:
+        c.execute('''
+            SELECT image_id, type, style, color, material, estimated_size, handcrafted FROM crafts
+            WHERE image_id IN (SELECT image_id FROM craft_tokens WHERE token IN (SELECT value FROM json_each(?)))
+            ORDER BY image_id
+        ''', (json.dumps(list(substrings)),))
+
+    best_match = None
+    best_score = 0
+    for image_id, *values in c:
+        score = sum(1 for value in values if value and value.lower() in text_lower)
+        if score > best_score:
+            best_score = score
+            best_match = (image_id, _craft_dict(values))
+    return best_match
+
+_craft_matcher = {}
+_craft_matcher_lock = threading.Lock()
+
+#(image_ids, TfidfMatcher) over every craft's descriptive fields, rebuilt only when crafts change
+def craft_matcher():
+    #imported here so scipy only loads once tfidf matching is used
+    from tfidf_matcher import TfidfMatcher
+    conn = get_connection("images")
+    state = conn.execute("SELECT COUNT(*), COALESCE(MAX(image_id), 0) FROM crafts").fetchone()
+    with _craft_matcher_lock:
+        if _craft_matcher.get("state") != state:
+            rows = conn.execute(f"SELECT image_id, {', '.join(SIMILARITY_FIELDS)} FROM crafts ORDER BY image_id").fetchall()
+            _craft_matcher["value"] = (
+                [row[0] for row in rows],
+                TfidfMatcher([" ".join(value for value in row[1:] if value) for row in rows])
+            )
+            _craft_matcher["state"] = state
+        return _craft_matcher["value"]
+
+#most similar craft to `text` by TF-IDF over character n-grams, if any scores >= threshold
+#(threshold None is tfidf_matcher.DEFAULT_THRESHOLD)
+def best_craft_by_similarity(text, threshold=None):
+    from tfidf_matcher import DEFAULT_THRESHOLD
+    image_ids, matcher = craft_matcher()
+    best = matcher.top_k([text or ""], k=1, threshold=DEFAULT_THRESHOLD if threshold is None else threshold)[0]
+    if not best:
+        return None
+    image_id = image_ids[best[0][0]]
+    row = get_connection("images").execute("SELECT type, style, color, material, estimated_size, handcrafted FROM crafts WHERE image_id = ?", (image_id,)).fetchone()
+    return image_id, _craft_dict(row)
+
+#craft to pitch for `text` with the configured CRAFT_MATCHER, falling back to the oldest craft
+def best_craft(text):
+    if CRAFT_MATCHER == "tfidf":
+        match = best_craft_by_similarity(text)
+    else:
+        match = best_craft_for_text(text)
+    return match or first_craft()
+
+#oldest craft, used when nothing matches
+def first_craft():
+    row = get_connection("images").execute("SELECT image_id, type, style, color, material, estimated_size, handcrafted FROM crafts ORDER BY image_id LIMIT 1").fetchone()
+    return (row[0], _craft_dict(row[1:])) if row else None
+
+def get_image_blob(image_id):
+    row = get_connection("images").execute("SELECT image FROM images WHERE id = ?", (image_id,)).fetchone()
+    return row[0] if row else None
@@ -1,71 +1,196 @@
-import streamlit as st
-import sqlite3
-import asyncio
+import time
 import os
 from dotenv import load_dotenv
+from connections import get_connection, transaction
+from read_cache import cached_read
+from db import image_hash, find_image_by_hash, get_image_blob
 ENV_FILE = '.env'
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "20"))
+#client id of the demo client in the "Dummy user interface" tab
+DUMMY_CLIENT_ID = "hardik_sharma"
+MIGRATION_BATCH = 100
 
 
+#UI reads below are cached until their database sees a commit (read_cache.py)
+@cached_read("potential_clients")
 def fetch_clients():
-    conn = sqlite3.connect("potential_clients.db")
-    cursor = conn.cursor()
-    cursor.execute("SELECT name, email, reason FROM clients")
-    clients = cursor.fetchall()
-    conn.close()
-    return clients
+    return get_connection("potential_clients").execute("SELECT name, email, reason FROM clients").fetchall()
+
+_messaged_db_ready = False
+
+def messaged_connection():
+    global _messaged_db_ready
+    conn = get_connection("potential_clients")
+    if not _messaged_db_ready:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS messaged_clients (
+                name TEXT PRIMARY KEY
+            )
+        """)
+        _messaged_db_ready = True
+    return conn
 
+@cached_read("potential_clients")
 def fetch_messaged_clients():
-    conn = sqlite3.connect("potential_clients.db")
+    rows = messaged_connection().execute("SELECT name FROM messaged_clients").fetchall()
+    return frozenset(name for (name,) in rows)
+
+def mark_client_messaged(name):
+    messaged_connection().execute("INSERT OR IGNORE INTO messaged_clients (name) VALUES (?)", (name,))
+
+def chat_client_id(name):
+    return name.lower().replace(' ', '_')
+
+def init_chat_db():
+    with transaction("chat_history", immediate=True) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id TEXT NOT NULL,
+                ts REAL NOT NULL,
+                sender TEXT,
+                message TEXT,
+                image_ref INTEGER,
+                image BLOB
+            )
+        """)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(chat_messages)")}
+        if "image_hash" not in columns:
+            conn.execute("ALTER TABLE chat_messages ADD COLUMN image_hash TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_client_ts ON chat_messages (client_id, ts)")
+        # finds rows still holding an inline image without scanning the table
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_messages_inline ON chat_messages (id) WHERE image IS NOT NULL")
+        # sent images that are not in the catalog, stored once per content hash
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS chat_images (
+                image_hash TEXT PRIMARY KEY,
+                image BLOB NOT NULL
+            )
+        """)
+        migrate_chat_tables(conn)
+    if migrate_inline_images():
+        # give the space of the copied BLOBs back (in WAL mode the file shrinks at checkpoint)
+        get_connection("chat_history").execute("VACUUM")
+        get_connection("chat_history").execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+#move rows from the old per-client chat_<name> tables into chat_messages, keeping their order
+def migrate_chat_tables(conn):
     cursor = conn.cursor()
     cursor.execute("""
-        CREATE TABLE IF NOT EXISTS messaged_clients (
-            name TEXT PRIMARY KEY
-        )
+        SELECT name FROM sqlite_master
+        WHERE type = 'table' AND name LIKE 'chat\\_%' ESCAPE '\\' AND name NOT IN ('chat_messages', 'chat_images')
     """)
-    cursor.execute("SELECT name FROM messaged_clients")
-    rows = cursor.fetchall()
-    conn.close()
-    return {name for (name,) in rows}
+    tables = [name for (name,) in cursor.fetchall()]
+    if not tables:
+        return
+    now = time.time()
+    for table_name in tables:
+        cursor.execute(f"""
+            INSERT INTO chat_messages (client_id, ts, sender, message, image)
+            SELECT ?, ?, sender, message, image FROM "{table_name}" ORDER BY id
+        """, (table_name[len("chat_"):], now))
+        cursor.execute(f'DROP TABLE "{table_name}"')
+    print(f"Migrated {len(tables)} chat tables into chat_messages.")
 
-def mark_client_messaged(name):
-    conn = sqlite3.connect("potential_clients.db")
-    cursor = conn.cursor()
-    cursor.execute("INSERT OR IGNORE INTO messaged_clients (name) VALUES (?)", (name,))
-    conn.commit()
-    conn.close()
+#replace image BLOBs copied into chat rows with a catalog image_ref (same bytes)
+#or an image_hash into chat_images; returns the number of rows converted
+def migrate_inline_images():
+    migrated = 0
+    while True:
+        rows = get_connection("chat_history").execute(
+            "SELECT id, image FROM chat_messages WHERE image IS NOT NULL ORDER BY id LIMIT ?", (MIGRATION_BATCH,)
+        ).fetchall()
+        if not rows:
+            break
+        with transaction("chat_history", immediate=True) as conn:
+            for message_id, image in rows:
+                content_hash = image_hash(image)
+                image_ref = find_image_by_hash(content_hash)
+                if image_ref is None:
+                    conn.execute("INSERT OR IGNORE INTO chat_images (image_hash, image) VALUES (?, ?)", (content_hash, image))
+                    conn.execute("UPDATE chat_messages SET image = NULL, image_hash = ? WHERE id = ?", (content_hash, message_id))
+                else:
+                    conn.execute("UPDATE chat_messages SET image = NULL, image_ref = ? WHERE id = ?", (image_ref, message_id))
+        migrated += len(rows)
+    if migrated:
+        print(f"Moved {migrated} inline chat images to references.")
+    return migrated
 
+_chat_db_ready = False
+
+def chat_connection():
+    global _chat_db_ready
+    if not _chat_db_ready:
+        init_chat_db()
+        _chat_db_ready = True
+    return get_connection("chat_history")
+
+def add_chat_message(name, sender, message, image_ref=None):
+    chat_connection().execute(
+        "INSERT INTO chat_messages (client_id, ts, sender, message, image_ref) VALUES (?, ?, ?, ?, ?)",
+        (chat_client_id(name), time.time(), sender, message, image_ref)
+    )
+
+#many (name, sender, message) rows in one transaction, timestamped in list order
+def add_chat_messages(rows):
+    now = time.time()
+    chat_connection()
+    with transaction("chat_history") as conn:
+        conn.executemany(
+            "INSERT INTO chat_messages (client_id, ts, sender, message) VALUES (?, ?, ?, ?)",
+            [(chat_client_id(name), now, sender, message) for name, sender, message in rows]
+        )
+
+#one page of a client's chat, oldest first, without image bytes: ([(id, sender, message, image_ref, image_hash)], older)
+#`before` is the `older` cursor of the previous page; `older` is None once the first message is included
+@cached_read("chat_history")
+def fetch_chat_page(client_id, before=None, limit=CHAT_PAGE_SIZE):
+    conn = chat_connection()
+    if before is None:
+        rows = conn.execute("""
+            SELECT id, ts, sender, message, image_ref, image_hash FROM chat_messages
+            WHERE client_id = ?
+            ORDER BY ts DESC, id DESC LIMIT ?
+        """, (client_id, limit + 1)).fetchall()
+    else:
+        ts, message_id = before
+        rows = conn.execute("""
+            SELECT id, ts, sender, message, image_ref, image_hash FROM chat_messages
+            WHERE client_id = ? AND (ts < ? OR (ts = ? AND id < ?))
+            ORDER BY ts DESC, id DESC LIMIT ?
+        """, (client_id, ts, ts, message_id, limit + 1)).fetchall()
+    older = (rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return [(message_id, sender, message, image_ref, content_hash)
+            for message_id, _, sender, message, image_ref, content_hash in reversed(rows[:limit])], older
+
+#bytes of a sent image, from the catalog (image_ref) or chat_images (image_hash)
+@cached_read("images", "chat_history", max_entries=16)
+def fetch_chat_image(image_ref, content_hash):
+    if image_ref is not None:
+        return get_image_blob(image_ref)
+    if content_hash is not None:
+        row = chat_connection().execute("SELECT image FROM chat_images WHERE image_hash = ?", (content_hash,)).fetchone()
+        return row[0] if row else None
+    return None
+
+#whole chat for one client in send order, images included
 def fetch_chat_history(name):
-    table_name = f"chat_{name.lower().replace(' ', '_')}"
-    
-    conn = sqlite3.connect("chat_history.db")
-    cursor = conn.cursor()
-    try:
-        cursor.execute(f"SELECT sender, message ,image FROM {table_name}")
-        chats = cursor.fetchall()
-    except Exception:
-        chats = []
-    conn.close()
-    return chats
-
-def chat_history_user():
-    table_name = "chat_hardik_sharma"
-    conn = sqlite3.connect("chat_history.db")
-    cursor = conn.cursor()
-    try:
-        cursor.execute(f"SELECT id, sender, message, image FROM {table_name} ORDER BY id")
-        chats = cursor.fetchall()
-    except Exception:
-        chats = []
-    conn.close()
-    return chats
+    rows = chat_connection().execute("""
+        SELECT m.sender, m.message, COALESCE(m.image, c.image), m.image_ref
+        FROM chat_messages m
+        LEFT JOIN chat_images c ON c.image_hash = m.image_hash
+        WHERE m.client_id = ?
+        ORDER BY m.ts, m.id
+    """, (chat_client_id(name),)).fetchall()
+    #catalog images are looked up by id, so chats without any never touch images.db
+    return [(sender, message, image if image is not None or image_ref is None else fetch_chat_image(image_ref, None))
+            for sender, message, image, image_ref in rows]
 
 def reset_chat_history_preserve_first():
-    table_name = "chat_hardik_sharma"
-    conn = sqlite3.connect("chat_history.db")
-    cursor = conn.cursor()
-    cursor.execute(f"DELETE FROM {table_name} WHERE id != 1")
-    conn.commit()
-    conn.close()
+    chat_connection().execute("""
+        DELETE FROM chat_messages
+        WHERE client_id = ? AND id != (SELECT MIN(id) FROM chat_messages WHERE client_id = ?)
+    """, (DUMMY_CLIENT_ID, DUMMY_CLIENT_ID))
 
 def save_api_key_to_env(api_key):
     env_vars = {}
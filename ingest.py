@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from db import find_image_by_hash, image_hash, save_images_batch
+from color_features import color_features_json
+from thumbnails import thumbnail_or_none
+from llm_parser import extract_metadata_from_image
+
+MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", "4"))
+
+
+def _analyze(name, image_bytes):
+    """Hash, dedupe check, metadata extraction (preprocessing included), colour features and thumbnail for one file."""
+    content_hash = image_hash(image_bytes)
+    existing_id = find_image_by_hash(content_hash)
+    if existing_id is not None:
+        return {"name": name, "status": "exists", "image_id": existing_id}
+
+    metadata = extract_metadata_from_image(image_bytes)
+    if "error" in metadata:
+        return {"name": name, "status": "failed", "error": metadata["error"]}
+    return {
+        "name": name,
+        "status": "analyzed",
+        "entry": (name, image_bytes, metadata, color_features_json(image_bytes), thumbnail_or_none(image_bytes))
+    }
+
+
+def ingest_images(files, max_workers=None, on_progress=None):
+    """
+    Analyzes uploaded (name, image_bytes) files concurrently and stores every
+    successful one in a single transaction.
+
+    on_progress(index, result, done, total) is called from the calling thread as each
+    file finishes. A file that fails is reported with status 'failed' and does
+    not stop the rest. Returns one result dict per file, in input order, with
+    status 'saved', 'exists' or 'failed'.
+    """
+    files = list(files)
+    results = [None] * len(files)
+    done = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers or MAX_WORKERS) as pool:
+        futures = {pool.submit(_analyze, name, image_bytes): i for i, (name, image_bytes) in enumerate(files)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"name": files[i][0], "status": "failed", "error": str(e)}
+            results[i] = result
+            done += 1
+            if on_progress:
+                on_progress(i, result, done, len(files))
+
+    pending = [i for i, result in enumerate(results) if result["status"] == "analyzed"]
+    if pending:
+        try:
+            ids = save_images_batch([results[i].pop("entry") for i in pending])
+            for i, image_id in zip(pending, ids):
+                results[i].update(status="saved", image_id=image_id)
+        except Exception as e:
+            for i in pending:
+                results[i].pop("entry", None)
+                results[i].update(status="failed", error=f"Saving failed: {e}")
+    return results
@@ -0,0 +1,127 @@
+"""
+Fast path for structured requests to CraftSalesAssistant.
+
+match_intent(prompt) recognizes requests whose tool sequence is fixed, in the
+phrasings the UI produces or people usually type:
+
+    refresh    "Refresh potential clients", "search clients from scratch"
+    pitch      "Send a pitch to Asha Rao", "send message to these users: [Asha Rao, Ravi K]"
+    image      "Send a photo to Asha Rao", "send a picture of the blue vase to Asha Rao"
+    followup   "Hardik Sharma replied with: <reply>" (asking for photos adds an image)
+
+and returns the intent and its parameters, or None. agent_handler runs a
+matched intent's tools directly; everything else, including requests naming
+someone who is not a potential client, still goes to the agent.
+
+Each routed request is credited with the planner calls the agent would have
+made for it (one per sequential tool stage, plus one for the final answer)
+and their time, at the mean latency of the agent's model calls so far
+(reported by agent_handler's SDK span processor; PLANNER_CALL_SECONDS until
+one has been seen, or when the SDK's tracing is disabled).
+"""
+import os
+import re
+import threading
+from function_handler import fetch_clients
+
+ROUTER_ENABLED = os.getenv("AGENT_ROUTER", "1") != "0"
+PLANNER_CALL_SECONDS = float(os.getenv("PLANNER_CALL_SECONDS", "1.0"))
+
+REFRESH = re.compile(
+    r"^(?:please\s+)?(?:refresh|update|rescan|search(?:\s+for)?|find)\s+(?:the\s+)?(?:new\s+)?(?:potential\s+)?"
+    r"(?:clients?|client\s+list|client\s+database|customers|database)"
+    r"[\s,.!()]*(?:(?:with\s+a\s+)?(?P<full>full(?:\s+refresh)?|fully|from\s+scratch)|(?P<fuzzy>fuzzy(?:\s+match(?:ing)?)?)|now)?[\s,.!()]*$",
+    re.I
+)
+PITCH = re.compile(
+    r"^(?:please\s+)?send\s+(?:an?\s+|the\s+)?(?:initial\s+)?(?:pitch(?:es)?|pitch\s+messages?|messages?)\s+to\s+"
+    r"(?:these\s+(?:users|clients)\s*:?\s*)?(?P<names>.+?)[\s.!]*$",
+    re.I | re.S
+)
+IMAGE = re.compile(
+    r"^(?:please\s+)?send\s+(?:an?\s+|the\s+)?(?:photo|image|picture|pic)s?(?:\s+of\s+(?P<subject>.+))?\s+(?:to|for)\s+"
+    r"(?P<name>.+?)[\s.!]*$",
+    re.I | re.S
+)
+FOLLOWUP = re.compile(r"^(?P<name>[^:\n]+?)\s+replied\s+with\s*:\s*(?P<reply>.+)$", re.I | re.S)
+IMAGE_WORDS = re.compile(r"\b(?:images?|photos?|pictures?|pics?|visuals?|show\s+me|see\s+(?:it|them|one))\b", re.I)
+NAME_SEPARATORS = re.compile(r"\s*(?:,|;|\band\b)\s*")
+
+_stats_lock = threading.Lock()
+_stats = {"routed": 0, "saved_calls": 0, "saved_seconds": 0.0, "planner_calls": 0, "planner_seconds": 0.0}
+
+
+def _client_names():
+    """Lower-cased name -> name for every potential client."""
+    return {name.lower(): name for name, _, _ in fetch_clients()}
+
+
+def _known(names):
+    clients = _client_names()
+    resolved = [clients.get(name.strip().strip("'\"").lower()) for name in names]
+    return resolved if resolved and all(resolved) else None
+
+
+def match_intent(prompt):
+    """{"intent": ..., parameters} for a structured request, or None to leave it to the agent."""
+    prompt = prompt.strip()
+
+    match = REFRESH.match(prompt)
+    if match:
+        return {"intent": "refresh", "full_refresh": bool(match.group("full")), "fuzzy_match": bool(match.group("fuzzy"))}
+
+    match = FOLLOWUP.match(prompt)
+    if match:
+        names = _known([match.group("name")])
+        if names is None:
+            return None
+        reply = match.group("reply").strip()
+        return {"intent": "followup", "name": names[0], "reply": reply, "wants_image": bool(IMAGE_WORDS.search(reply))}
+
+    match = IMAGE.match(prompt)
+    if match:
+        names = _known([match.group("name")])
+        if names is None:
+            return None
+        return {"intent": "image", "name": names[0], "subject": (match.group("subject") or "").strip()}
+
+    match = PITCH.match(prompt)
+    if match:
+        names = [name for name in NAME_SEPARATORS.split(match.group("names").strip("[] ")) if name.strip(" '\"")]
+        names = _known(names)
+        if names is None:
+            return None
+        return {"intent": "pitch", "names": list(dict.fromkeys(names))}
+
+    return None
+
+
+def planner_call_seconds():
+    """Mean seconds per observed agent model call, or PLANNER_CALL_SECONDS."""
+    with _stats_lock:
+        if not _stats["planner_calls"]:
+            return PLANNER_CALL_SECONDS
+        return _stats["planner_seconds"] / _stats["planner_calls"]
+
+
+def observe_planner_call(seconds):
+    """Records the duration of one model call made by the agent."""
+    with _stats_lock:
+        _stats["planner_calls"] += 1
+        _stats["planner_seconds"] += seconds
+
+
+def record_routed(stages):
+    """Credits a routed request with the planner calls it skipped; returns (calls, seconds) saved."""
+    saved_calls = stages + 1
+    saved_seconds = saved_calls * planner_call_seconds()
+    with _stats_lock:
+        _stats["routed"] += 1
+        _stats["saved_calls"] += saved_calls
+        _stats["saved_seconds"] += saved_seconds
+    return saved_calls, saved_seconds
+
+
+def router_stats():
+    with _stats_lock:
+        return dict(_stats)
@@ -0,0 +1,217 @@
+"""
+Persistent background queue for client refreshes.
+
+Jobs live in the jobs table of potential_clients.db and are run one at a time
+by a daemon worker thread (start_worker(), once per process). A job records
+its progress as it goes, can be cancelled while queued or running, and a job
+left 'running' by a process that died is queued again when the next worker
+starts. Refreshes are incremental and skip clients whose reasons are already
+stored, so a resumed job does not redo finished work.
+"""
+import os
+import json
+import time
+import asyncio
+import threading
+import traceback
+from connections import get_connection, transaction
+from tracing import traced
+
+POLL_INTERVAL = 1.0
+RESULT_PREVIEW = 20
+
+_worker_thread = None
+_worker_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def init_jobs_db():
+    with transaction("potential_clients", immediate=True) as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                updated_at REAL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)")
+
+
+def _job_dict(row):
+    keys = ["id", "kind", "params", "status", "progress", "result", "error", "cancel_requested",
+            "created_at", "started_at", "updated_at", "finished_at"]
+    job = dict(zip(keys, row))
+    for key in ("params", "progress", "result"):
+        job[key] = json.loads(job[key]) if job[key] else None
+    return job
+
+
+_JOB_COLUMNS = ("id, kind, params, status, progress, result, error, cancel_requested, "
+                "created_at, started_at, updated_at, finished_at")
+
+
+def submit_refresh(full_refresh=False, matcher=None):
+    """
+    Queues a client refresh and returns its job id. A refresh already queued
+    or running with the same parameters is reused instead of adding another.
+    """
+    params = json.dumps({"full_refresh": bool(full_refresh), "matcher": matcher})
+    with transaction("potential_clients", immediate=True) as conn:
+        row = conn.execute(
+            "SELECT id FROM jobs WHERE kind = 'refresh' AND params = ? AND status IN ('queued', 'running') ORDER BY id LIMIT 1",
+            (params,)
+        ).fetchone()
+        if row:
+            return row[0]
+        cursor = conn.execute(
+            "INSERT INTO jobs (kind, params, status, created_at) VALUES ('refresh', ?, 'queued', ?)",
+            (params, time.time())
+        )
+        return cursor.lastrowid
+
+
+def get_job(job_id):
+    row = get_connection("potential_clients").execute(
+        f"SELECT {_JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)
+    ).fetchone()
+    return _job_dict(row) if row else None
+
+
+def recent_jobs(limit=5):
+    rows = get_connection("potential_clients").execute(
+        f"SELECT {_JOB_COLUMNS} FROM jobs ORDER BY id DESC LIMIT ?", (limit,)
+    ).fetchall()
+    return [_job_dict(row) for row in rows]
+
+
+def cancel_job(job_id):
+    """Cancels a queued job at once; a running job stops after its current chunk."""
+    now = time.time()
+    with transaction("potential_clients", immediate=True) as conn:
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', finished_at = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+            (now, now, job_id)
+        )
+        conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = 'running'", (job_id,))
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def requeue_orphaned_jobs():
+    """Queues again any job left 'running' by a process that no longer exists."""
+    with transaction("potential_clients", immediate=True) as conn:
+        rows = conn.execute("SELECT id, owner FROM jobs WHERE status = 'running'").fetchall()
+        orphaned = [(job_id,) for job_id, owner in rows
+                    if not owner or int(owner) == os.getpid() or not _pid_alive(int(owner))]
+        conn.executemany("UPDATE jobs SET status = 'queued', owner = NULL WHERE id = ?", orphaned)
+    if orphaned:
+        print(f"Requeued {len(orphaned)} interrupted jobs.")
+
+
+def _claim_next():
+    now = time.time()
+    with transaction("potential_clients", immediate=True) as conn:
+        row = conn.execute(
+            f"SELECT {_JOB_COLUMNS} FROM jobs WHERE status = 'queued' ORDER BY id LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE jobs SET status = 'running', owner = ?, started_at = COALESCE(started_at, ?), updated_at = ? WHERE id = ?",
+            (str(os.getpid()), now, now, row[0])
+        )
+    return _job_dict(row)
+
+
+def _finish(job_id, status, result=None, error=None):
+    now = time.time()
+    get_connection("potential_clients").execute(
+        "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+        (status, json.dumps(result) if result is not None else None, error, now, now, job_id)
+    )
+
+
+@traced("job")
+def _run_refresh(job):
+    from client_search import refresh_potential_clients
+
+    conn = get_connection("potential_clients")
+
+    def on_progress(progress):
+        conn.execute("UPDATE jobs SET progress = ?, updated_at = ? WHERE id = ?",
+                     (json.dumps(progress), time.time(), job["id"]))
+        if conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job["id"],)).fetchone()[0]:
+            raise JobCancelled()
+
+    params = job["params"]
+    written = asyncio.run(refresh_potential_clients(params["full_refresh"], params["matcher"], on_progress=on_progress))
+    return {
+        "clients": len(written),
+        "preview": [f"{name} ({email}) - {reason}" for name, email, reason in written[:RESULT_PREVIEW]],
+    }
+
+
+HANDLERS = {"refresh": _run_refresh}
+
+
+def run_next_job():
+    """Claims and runs the oldest queued job in this thread. Returns False when the queue is empty."""
+    job = _claim_next()
+    if job is None:
+        return False
+    print(f"Running job {job['id']} ({job['kind']})...")
+    try:
+        result = HANDLERS[job["kind"]](job)
+    except JobCancelled:
+        _finish(job["id"], "cancelled")
+        print(f"Job {job['id']} cancelled.")
+    except Exception as e:
+        _finish(job["id"], "failed", error=f"{e}\n{traceback.format_exc()}")
+        print(f"Job {job['id']} failed: {e}")
+    else:
+        _finish(job["id"], "done", result=result)
+        print(f"Job {job['id']} done.")
+    return True
+
+
+def _worker_loop():
+    init_jobs_db()
+    requeue_orphaned_jobs()
+    while True:
+        try:
+            if not run_next_job():
+                time.sleep(POLL_INTERVAL)
+        except Exception as e:
+            print(f"Job worker error: {e}")
+            time.sleep(POLL_INTERVAL)
+
+
+def start_worker():
+    """Starts this process's job worker thread, once."""
+    global _worker_thread
+    with _worker_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(target=_worker_loop, name="job-worker", daemon=True)
+            _worker_thread.start()
+    return _worker_thread
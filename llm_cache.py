@@ -0,0 +1,148 @@
+import re
+import time
+import hashlib
+import threading
+from connections import get_connection, transaction
+
+
+def completion_key(model, prompt, temperature):
+    """
+    Cache key for a chat completion. Whitespace in the prompt is collapsed, so
+    re-indented f-strings with the same content share an entry.
+    """
+    normalized = re.sub(r"\s+", " ", prompt).strip()
+    return hashlib.sha256(f"{model}\x00{temperature}\x00{normalized}".encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """
+    Persistent key -> text cache in a SQLite table (llm_cache.db by default),
+    bounded by the total size of stored values. The least recently used entries
+    are evicted first. Entries written with a ttl (seconds, falling back to the
+    cache's default) count as misses once they expire.
+
+    The running total of stored bytes lives in cache_totals and is updated in
+    the same transaction as every insert and delete, so writes never sum the
+    table. A hit only rewrites last_used when it is more than TOUCH_INTERVAL
+    seconds old, so most reads stay reads; recency is as coarse as that.
+    """
+
+    TOUCH_INTERVAL = 60.0
+
+    def __init__(self, table, max_bytes, db="llm_cache", ttl=None):
+        self.table = table
+        self.max_bytes = max_bytes
+        self.db = db
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        with transaction(self.db, immediate=True) as conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    expires_at REAL
+                )
+            """)
+            columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if "expires_at" not in columns:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN expires_at REAL")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_used ON {table} (last_used)")
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_expires ON {table} (expires_at) WHERE expires_at IS NOT NULL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_totals (
+                    cache TEXT PRIMARY KEY,
+                    bytes INTEGER NOT NULL
+                )
+            """)
+            # recounted once per open, so a total gone stale (rows deleted by hand) corrects itself
+            conn.execute(
+                f"INSERT OR REPLACE INTO cache_totals (cache, bytes) SELECT ?, COALESCE(SUM(size), 0) FROM {table}",
+                (table,)
+            )
+
+    def get(self, key):
+        conn = get_connection(self.db)
+        row = conn.execute(f"SELECT value, expires_at, last_used FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is None or (row[1] is not None and row[1] <= now):
+            if row is not None:
+                with self.lock, transaction(self.db, immediate=True) as conn:
+                    self._delete(conn, [key])
+            self.misses += 1
+            return None
+        if now - row[2] >= self.TOUCH_INTERVAL:
+            conn.execute(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return row[0]
+
+    def put(self, key, value, ttl=None):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        ttl = ttl if ttl is not None else self.ttl
+        now = time.time()
+        with self.lock, transaction(self.db, immediate=True) as conn:
+            old = conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, last_used, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now + ttl if ttl else None)
+            )
+            self._add_bytes(conn, size - (old[0] if old else 0))
+            self._evict(conn, now)
+
+    def clear(self):
+        """Removes every entry."""
+        with self.lock, transaction(self.db, immediate=True) as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+            conn.execute("UPDATE cache_totals SET bytes = 0 WHERE cache = ?", (self.table,))
+
+    def stats(self):
+        """Hit/miss counters for this process, plus the table's current size."""
+        conn = get_connection(self.db)
+        count = conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": count,
+            "bytes": self._total(conn),
+        }
+
+    def _total(self, conn):
+        return conn.execute("SELECT bytes FROM cache_totals WHERE cache = ?", (self.table,)).fetchone()[0]
+
+    def _add_bytes(self, conn, delta):
+        if delta:
+            conn.execute("UPDATE cache_totals SET bytes = bytes + ? WHERE cache = ?", (delta, self.table))
+
+    def _delete(self, conn, keys):
+        freed = 0
+        for key in keys:
+            row = conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row:
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                freed += row[0]
+        self._add_bytes(conn, -freed)
+
+    def _evict(self, conn, now):
+        expired = [key for (key,) in conn.execute(
+            f"SELECT key FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        )]
+        self._delete(conn, expired)
+        total = self._total(conn)
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        victims = []
+        for key, size in conn.execute(f"SELECT key, size FROM {self.table} ORDER BY last_used"):
+            victims.append((key,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", victims)
+        self._add_bytes(conn, -freed)
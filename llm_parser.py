@@ -1,39 +1,161 @@
+import io
 import os
+import time
 import base64
 import json
-from openai import OpenAI
+import hashlib
+import threading
 from dotenv import load_dotenv
+from llm_cache import LRUCache
+from tracing import span, traced
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+_client = None
+
+MODEL = "gpt-4o"
+
+# pre-upload preprocessing: longest edge in pixels, output format (JPEG or WEBP) and target payload size
+MAX_EDGE = int(os.getenv("VISION_MAX_EDGE", "1024"))
+UPLOAD_FORMAT = os.getenv("VISION_UPLOAD_FORMAT", "JPEG").upper()
+TARGET_BYTES = int(os.getenv("VISION_TARGET_BYTES", str(300 * 1024)))
+QUALITY_STEPS = (85, 75, 65, 55, 45)
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png", "GIF": "image/gif"}
+SYSTEM_PROMPT = "you are an expert in analyzing handicraft images. Extract important metadata as structured JSON.Always return valid JSON format."
+USER_PROMPT = "Extract metadata from this handicraft image. Return ONLY valid JSON with keys:color,material,type,style, estimated_size,handcrafted.No additional text or formatting."
+# bump when the request changes in a way the prompts above don't capture
+PROMPT_VERSION = "1"
+PROMPT_KEY = hashlib.sha256(
+    f"{MODEL}\n{PROMPT_VERSION}\n{SYSTEM_PROMPT}\n{USER_PROMPT}\n{MAX_EDGE}:{UPLOAD_FORMAT}:{TARGET_BYTES}".encode("utf-8")
+).hexdigest()[:16]
+
+_metadata_cache = None
+_metadata_cache_lock = threading.Lock()
+
+def get_metadata_cache():
+    """The extracted-metadata cache, opened on first use so importing this module writes nothing."""
+    global _metadata_cache
+    with _metadata_cache_lock:
+        if _metadata_cache is None:
+            _metadata_cache = LRUCache("image_metadata", max_bytes=int(os.getenv("METADATA_CACHE_MAX_BYTES", str(16 * 1024 * 1024))))
+        return _metadata_cache
+
+def get_client():
+    """The OpenAI client for metadata extraction, created on first use (the openai package is slow to import)."""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=os.getenv("OPENAI_BASE_URL") or None)
+    return _client
+
+def image_hash(file_bytes:bytes)->str:
+    return hashlib.sha256(file_bytes).hexdigest()
+
+@traced("image")
+def preprocess_image(file_bytes:bytes, max_edge:int=None, fmt:str=None, target_bytes:int=None):
+    """
+    Decodes the upload once, applies the EXIF orientation, bounds the longest
+    edge and re-encodes without metadata, lowering quality until the result fits
+    target_bytes (or the lowest step is reached).
+    Returns (payload_bytes, mime_type, stats).
+    """
+    # imported here so PIL only loads once an image is uploaded, not at app start
+    from PIL import Image, ImageOps
+    max_edge = max_edge or MAX_EDGE
+    fmt = (fmt or UPLOAD_FORMAT).upper()
+    target_bytes = target_bytes or TARGET_BYTES
+    start = time.perf_counter()
+
+    image = Image.open(io.BytesIO(file_bytes))
+    source_format = image.format
+    source_size = image.size
+    has_exif = bool(image.getexif())
+    image.draft("RGB", (max_edge, max_edge))
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_edge, max_edge))
+
+    if fmt == "JPEG" and image.mode != "RGB":
+        rgba = image.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.split()[3])
+        image = background
+    elif fmt == "WEBP" and image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA")
+
+    for quality in QUALITY_STEPS:
+        buffer = io.BytesIO()
+        image.save(buffer, format=fmt, quality=quality, optimize=True)
+        payload = buffer.getvalue()
+        if len(payload) <= target_bytes:
+            break
+
+    mime_type = MIME_TYPES[fmt]
+    # small, already-bounded uploads with nothing to strip can be cheaper as they are
+    if (len(payload) >= len(file_bytes) and source_format in MIME_TYPES and not has_exif
+            and max(source_size) <= max_edge):
+        payload, mime_type = file_bytes, MIME_TYPES[source_format]
+
+    stats = {
+        "source_format": source_format,
+        "original_bytes": len(file_bytes),
+        "payload_bytes": len(payload),
+        "bytes_saved": len(file_bytes) - len(payload),
+        "size": image.size,
+        "quality": quality,
+        "encode_seconds": time.perf_counter() - start
+    }
+    return payload, mime_type, stats
+
+def _upload_payload(file_bytes:bytes):
+    try:
+        payload, mime_type, stats = preprocess_image(file_bytes)
+        print(f"Image preprocessed: {stats['original_bytes']} -> {stats['payload_bytes']} bytes "
+              f"({stats['bytes_saved']} saved) in {stats['encode_seconds'] * 1000:.0f} ms")
+        return payload, mime_type
+    except Exception as e:
+        # fall back to the raw upload, labelled with whatever Pillow can tell about it
+        print(f"Image preprocessing failed, sending original: {e}")
+        try:
+            from PIL import Image
+            mime_type = MIME_TYPES.get(Image.open(io.BytesIO(file_bytes)).format, "image/jpeg")
+        except Exception:
+            mime_type = "image/jpeg"
+        return file_bytes, mime_type
 
 def extract_metadata_from_image(file_bytes:bytes)->dict:
+    cache_key = f"{image_hash(file_bytes)}:{PROMPT_KEY}"
+    cached = get_metadata_cache().get(cache_key)
+    if cached is not None:
+        return json.loads(cached)
+
     try:
-        base64_image = base64.b64encode(file_bytes).decode("utf-8")
-
-        response = client.chat.completions.create(
-            model ="gpt-4o",
-            messages =[
-                {"role":"system" , "content":"you are an expert in analyzing handicraft images. Extract important metadata as structured JSON.Always return valid JSON format."},
-                {
-                    "role":"user",
-                    "content":[
-                        {
-                            "type":"text",
-                            "text":"Extract metadata from this handicraft image. Return ONLY valid JSON with keys:color,material,type,style, estimated_size,handcrafted.No additional text or formatting."
-                        },
-                        {
-                            "type":"image_url",
-                            "image_url":{
-                                "url": f"data:image/jpeg;base64,{base64_image}"
+        payload, mime_type = _upload_payload(file_bytes)
+        base64_image = base64.b64encode(payload).decode("utf-8")
+
+        with span("openai", "chat.completions.vision") as call:
+            response = get_client().chat.completions.create(
+                model =MODEL,
+                messages =[
+                    {"role":"system" , "content":SYSTEM_PROMPT},
+                    {
+                        "role":"user",
+                        "content":[
+                            {
+                                "type":"text",
+                                "text":USER_PROMPT
+                            },
+                            {
+                                "type":"image_url",
+                                "image_url":{
+                                    "url": f"data:{mime_type};base64,{base64_image}"
+                                }
                             }
-                        }
-                    ]
-                }
-            ],
-            max_tokens = 500,
-            temperature =0.2
-        )
+                        ]
+                    }
+                ],
+                max_tokens = 500,
+                temperature =0.2
+            )
+            call.usage(response)
 
         content = response.choices[0].message.content.strip()
         
@@ -43,7 +165,9 @@ def extract_metadata_from_image(file_bytes:bytes)->dict:
             content = content[3:-3].strip()
 
         try:
-            return json.loads(content)
+            metadata = json.loads(content)
+            get_metadata_cache().put(cache_key, json.dumps(metadata))
+            return metadata
         except json.JSONDecodeError as json_error:
             return{
                 "error":f"JSON parsing failed:{str(json_error)}",
@@ -0,0 +1,260 @@
+"""
+Local stand-in for the OpenAI chat completions endpoint.
+
+Point the app at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1 to run
+without a key or network (the agent then talks chat completions too, see
+AGENT_OPENAI_API in agent_handler.py):
+
+    python mock_openai_server.py --port 8001 --latency 0.2 --error-rate 0.1 [--script script.json]
+
+Replies are scripted on the text of the last user message. A script is JSON:
+
+    {"replies": [["regex", "reply text"], ...],
+     "tools": [["regex", "tool_name", {"arg": "value", ...}], ...]}
+
+The first matching `replies` rule picks the reply (otherwise the default reply,
+or the prompt itself with --echo). When a request offers tools, each matching
+`tools` rule whose tool is offered is called once, in order, one call per
+response. "{tool_output}" in a string argument is replaced by the latest tool
+result, and "{group}" by that named group of the rule's regex. Once all are
+called the model answers with text. "stream": true is answered as server-sent
+chunks, --chunk-delay seconds apart.
+
+With a fake key, also set OPENAI_AGENTS_DISABLE_TRACING=1 so the agent does
+not try to upload traces.
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STREAM_CHUNK_WORDS = 3
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_status=429, reply="Mock reply from crafts team.", echo=False,
+                 replies=None, tool_script=None, chunk_delay=0.0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reply = reply
+        self.echo = echo
+        self.replies = [(re.compile(pattern, re.I), text) for pattern, text in replies or []]
+        self.tool_script = [(re.compile(pattern, re.I), name, arguments) for pattern, name, arguments in tool_script or []]
+        self.chunk_delay = chunk_delay
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "errors": 0, "in_flight": 0, "max_in_flight": 0, "tool_calls": 0, "streamed": 0}
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: MockOpenAIServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            request = {}
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+
+        with server.lock:
+            server.stats["requests"] += 1
+            server.stats["in_flight"] += 1
+            server.stats["max_in_flight"] = max(server.stats["max_in_flight"], server.stats["in_flight"])
+        try:
+            time.sleep(server.latency + random.uniform(0, server.jitter))
+
+            if random.random() < server.error_rate:
+                with server.lock:
+                    server.stats["errors"] += 1
+                self._send_json(
+                    server.error_status,
+                    {"error": {"message": "Injected error", "type": "rate_limit_error", "code": None}},
+                    headers={"retry-after": "0"} if server.error_status == 429 else None
+                )
+                return
+
+            reply, tool_call = _respond(server, request)
+            if tool_call:
+                with server.lock:
+                    server.stats["tool_calls"] += 1
+            if request.get("stream"):
+                with server.lock:
+                    server.stats["streamed"] += 1
+                self._send_stream(request, reply, tool_call)
+            else:
+                self._send_json(200, _completion(request, reply, tool_call))
+        finally:
+            with server.lock:
+                server.stats["in_flight"] -= 1
+
+
+    def _send_stream(self, request, reply, tool_call):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        chunk_id = f"chatcmpl-mock-{random.getrandbits(32):08x}"
+
+        def send(choices, usage=None):
+            chunk = {"id": chunk_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": request.get("model", "gpt-4o"), "choices": choices}
+            if usage is not None:
+                chunk["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        send([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+        if tool_call:
+            send([{"index": 0, "delta": {"tool_calls": [{"index": 0, **tool_call}]}, "finish_reason": None}])
+        else:
+            words = reply.split(" ")
+            for start in range(0, len(words), STREAM_CHUNK_WORDS):
+                time.sleep(self.server.chunk_delay)
+                text = " ".join(words[start:start + STREAM_CHUNK_WORDS])
+                send([{"index": 0, "delta": {"content": text if start == 0 else " " + text}, "finish_reason": None}])
+        send([{"index": 0, "delta": {}, "finish_reason": "tool_calls" if tool_call else "stop"}])
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send([], _usage(request, reply, tool_call))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+def _text(content):
+    """Text of a message's content, whether a string or a list of parts."""
+    if isinstance(content, list):
+        return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return str(content or "")
+
+
+def _respond(server, request):
+    """(reply text, tool call or None) for a request, following the server's script."""
+    messages = request.get("messages", [])
+    user_index = max((i for i, m in enumerate(messages) if m.get("role") == "user"), default=-1)
+    prompt = _text(messages[user_index].get("content")) if user_index >= 0 else ""
+
+    offered = {tool.get("function", {}).get("name") for tool in request.get("tools") or []}
+    if offered:
+        turn = messages[user_index + 1:]
+        called = [call["function"]["name"] for m in turn for call in m.get("tool_calls") or []]
+        outputs = [_text(m.get("content")) for m in turn if m.get("role") == "tool"]
+        pending = [(name, arguments, match) for pattern, name, arguments in server.tool_script
+                   if name in offered for match in [pattern.search(prompt)] if match]
+        if len(called) < len(pending):
+            name, arguments, match = pending[len(called)]
+            fills = dict(match.groupdict(), tool_output=outputs[-1] if outputs else "")
+            arguments = {key: _fill(value, fills) for key, value in arguments.items()}
+            return None, {"id": f"call_{random.getrandbits(48):012x}", "type": "function",
+                          "function": {"name": name, "arguments": json.dumps(arguments)}}
+
+    for pattern, text in server.replies:
+        if pattern.search(prompt):
+            return text, None
+    if server.echo and messages:
+        return _text(messages[-1].get("content")).strip(), None
+    return server.reply, None
+
+
+def _fill(value, fills):
+    if not isinstance(value, str):
+        return value
+    for key, fill in fills.items():
+        value = value.replace("{" + key + "}", fill or "")
+    return value
+
+
+def _usage(request, reply, tool_call):
+    prompt_tokens = sum(len(_text(m.get("content")).split()) for m in request.get("messages", []))
+    completion_tokens = len((reply or json.dumps(tool_call)).split())
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+def _completion(request, reply, tool_call=None):
+    message = {"role": "assistant", "content": reply}
+    if tool_call:
+        message["tool_calls"] = [tool_call]
+    return {
+        "id": f"chatcmpl-mock-{random.getrandbits(32):08x}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "gpt-4o"),
+        "choices": [{
+            "index": 0,
+            "message": message,
+            "finish_reason": "tool_calls" if tool_call else "stop"
+        }],
+        "usage": _usage(request, reply, tool_call)
+    }
+
+
+def load_script(path):
+    with open(path) as f:
+        script = json.load(f)
+    return script.get("replies", []), script.get("tools", [])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--echo", action="store_true", help="reply with the last message's content")
+    parser.add_argument("--script", help="JSON file of scripted replies and tool calls")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    args = parser.parse_args()
+
+    replies, tool_script = load_script(args.script) if args.script else ([], [])
+    server = MockOpenAIServer(args.host, args.port, args.latency, args.jitter, args.error_rate, args.error_status,
+                              echo=args.echo, replies=replies, tool_script=tool_script, chunk_delay=args.chunk_delay)
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,157 @@
+import os
+import asyncio
+import threading
+from connections import get_connection, transaction
+from db import best_craft
+from function_handler import add_chat_messages, mark_client_messaged
+from llm_cache import LRUCache, completion_key
+from reason_generator import generate_reasons
+
+MESSAGE_MODEL = "gpt-4o"
+MESSAGE_TEMPERATURE = 1.0
+_completion_cache = None
+_completion_cache_lock = threading.Lock()
+
+
+def get_completion_cache():
+    """The pitch completion cache, opened on first use so importing this module writes nothing."""
+    global _completion_cache
+    with _completion_cache_lock:
+        if _completion_cache is None:
+            _completion_cache = LRUCache(
+                "completions",
+                max_bytes=int(os.getenv("COMPLETION_CACHE_MAX_BYTES", str(4 * 1024 * 1024))),
+                ttl=float(os.getenv("COMPLETION_CACHE_TTL", str(24 * 3600)))
+            )
+        return _completion_cache
+
+
+def product_fields(metadata):
+    return {
+        "style": metadata.get("style", "unique"),
+        "material": metadata.get("material", "premium material"),
+        "estimated_size": metadata.get("estimated_size", "standard size"),
+        "handcrafted": metadata.get("handcrafted", "yes"),
+        "color": metadata.get("color", "classic tone"),
+    }
+
+
+def pitch_prompt(name, reason, metadata):
+    fields = product_fields(metadata)
+    product_details = f"""
+    Client Name: {name}
+    Product Details:
+        - Material: {fields['material']}
+        - Style: {fields['style']}
+        - Color: {fields['color']}
+        - Size: {fields['estimated_size']}
+        - Handcrafted: {fields['handcrafted']}
+    Reason for Interest: {reason}
+    """
+    return f"""
+        You are a creative marketing assistant.
+
+        Using the following client and product details,type write a short(2-3 lines), friendly, and attractive message that encourages the client to explore the product:
+
+        {product_details}
+
+        Keep it professional yet warm.
+        After warm ragards add from crafts team only.
+        """
+
+
+def _client_reasons(names):
+    rows = get_connection("potential_clients").execute(
+        f"SELECT name, reason FROM clients WHERE name IN ({','.join('?' * len(names))}) ORDER BY rowid",
+        names
+    ).fetchall()
+    reasons = {}
+    for name, reason in rows:
+        reasons.setdefault(name, reason)
+    return reasons
+
+
+def _prepare_pitches(names, bypass_cache):
+    """Per-name results (cached messages filled in) and the (index, prompt, key) pitches still to generate."""
+    reasons = _client_reasons(names)
+    results = []
+    pending = []
+    for name in names:
+        if name not in reasons:
+            results.append({"name": name, "status": "failed", "error": "No data found in potential clients database."})
+            continue
+        best_match = best_craft(reasons[name])
+        if not best_match:
+            results.append({"name": name, "status": "failed", "error": "No crafts found to reference."})
+            continue
+        prompt = pitch_prompt(name, reasons[name], best_match[1])
+        key = completion_key(MESSAGE_MODEL, prompt, MESSAGE_TEMPERATURE)
+        message = None if bypass_cache else get_completion_cache().get(key)
+        results.append({"name": name, "status": "sent", "message": message})
+        if message is None:
+            pending.append((len(results) - 1, prompt, key))
+    return results, pending
+
+
+def _store_pitches(results, generated):
+    """Caches the generated (key, reply) pairs, writes the sent pitches to the chat and marks their clients messaged."""
+    cache = get_completion_cache()
+    for key, reply in generated:
+        cache.put(key, reply)
+
+    sent = [result for result in results if result["status"] == "sent"]
+    try:
+        add_chat_messages([(result["name"], "agent", result["message"]) for result in sent])
+    except Exception as e:
+        for result in sent:
+            result.pop("message")
+            result.update(status="failed", error=f"Failed to store message: {e}")
+        sent = []
+
+    try:
+        with transaction("potential_clients"):
+            for result in sent:
+                mark_client_messaged(result["name"])
+    except Exception as e:
+        print(f"Failed to mark clients as messaged: {e}")
+    return sent
+
+
+async def send_pitches(names, max_in_flight=None, rate_per_sec=None, client=None, bypass_cache=False):
+    """
+    Frames and sends the first pitch to every client in `names` without going
+    through the agent. Pitches are generated concurrently (answered from the
+    completion cache when possible), all chat rows are written in one
+    transaction, and only clients whose pitch was sent are marked messaged.
+    The SQLite work (craft lookups, cache, chat rows) runs in a worker thread,
+    so it never blocks the event loop.
+
+    Returns one {"name", "status": "sent" | "failed", "message" | "error"} dict
+    per name, in input order.
+    """
+    names = list(dict.fromkeys(names))
+    if not names:
+        return []
+    results, pending = await asyncio.to_thread(_prepare_pitches, names, bypass_cache)
+
+    generated = []
+    if pending:
+        print(f"Generating {len(pending)} pitches ({len(names) - len(pending)} cached or skipped)...")
+        replies = await generate_reasons(
+            [prompt for _, prompt, _ in pending],
+            model=MESSAGE_MODEL,
+            max_in_flight=max_in_flight,
+            rate_per_sec=rate_per_sec,
+            client=client
+        )
+        for (i, _, key), reply in zip(pending, replies):
+            if reply is None:
+                results[i].update(status="failed", error="Failed to generate message.")
+                results[i].pop("message")
+            else:
+                results[i]["message"] = reply
+                generated.append((key, reply))
+
+    sent = await asyncio.to_thread(_store_pitches, results, generated)
+    print(f"Outreach: {len(sent)} sent, {len(results) - len(sent)} failed.")
+    return results
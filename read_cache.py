@@ -0,0 +1,51 @@
+"""
+In-process caching of UI reads, invalidated by commits instead of by time.
+
+A function decorated with @cached_read("db", ...) keeps its last results per
+argument tuple, each stamped with the PRAGMA data_version of the databases it
+reads. A call whose databases have seen no commit since is served from memory;
+any write, from a tool, the UI, the job worker or another process, changes the
+version and the next call reads again. Results are shared between callers and
+must be treated as read-only.
+"""
+import functools
+import threading
+from collections import OrderedDict
+from connections import data_version
+
+MAX_ENTRIES = 64
+
+
+def cached_read(*dbs, max_entries=MAX_ENTRIES):
+    def decorator(fn):
+        entries = OrderedDict()
+        lock = threading.Lock()
+        counts = {"hits": 0, "misses": 0}
+
+        @functools.wraps(fn)
+        def wrapper(*args):
+            # read before the query, so a commit racing with it only costs a re-read
+            version = tuple(data_version(db) for db in dbs)
+            with lock:
+                entry = entries.get(args)
+                if entry is not None and entry[0] == version:
+                    entries.move_to_end(args)
+                    counts["hits"] += 1
+                    return entry[1]
+                counts["misses"] += 1
+            result = fn(*args)
+            with lock:
+                entries[args] = (version, result)
+                entries.move_to_end(args)
+                while len(entries) > max_entries:
+                    entries.popitem(last=False)
+            return result
+
+        def stats():
+            with lock:
+                return dict(counts, entries=len(entries))
+
+        wrapper.stats = stats
+        wrapper.cache_clear = entries.clear
+        return wrapper
+    return decorator
@@ -0,0 +1,132 @@
+import os
+import time
+import random
+import asyncio
+from dotenv import load_dotenv
+from tracing import span
+
+load_dotenv()
+
+MAX_IN_FLIGHT = int(os.getenv("REASON_MAX_IN_FLIGHT", "8"))
+RATE_PER_SEC = float(os.getenv("REASON_RATE_PER_SEC", "5"))
+MAX_RETRIES = int(os.getenv("REASON_MAX_RETRIES", "5"))
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+
+
+class TokenBucket:
+    """Async token bucket: refills `rate` tokens per second up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def build_reason_prompt(matched_triggers, name, last_bought, liked, address):
+    return f"""
+                You are an expert product marketer.
+
+                Craft Product Triggers: {', '.join(matched_triggers)}
+                Client Details:
+                    - Name: {name}
+                    - Last Bought: {last_bought}
+                    - Liked Products: {liked}
+                    - Address: {address}
+
+                Write a short professional summary explaining why this client is a good match for the crafts.
+                """
+
+
+def _retry_delay(error, attempt):
+    retry_after = None
+    response = getattr(error, "response", None)
+    if response is not None:
+        retry_after = response.headers.get("retry-after")
+    if retry_after:
+        try:
+            return float(retry_after) + random.uniform(0, BACKOFF_BASE)
+        except ValueError:
+            pass
+    # full jitter
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+async def _complete(client, bucket, semaphore, prompt, model, max_retries):
+    import openai
+    # callers pass clients with max_retries=0, so 429s, 5xx, connection errors and timeouts
+    # (APITimeoutError is an APIConnectionError) are all retried here with the same backoff
+    async with semaphore:
+        for attempt in range(max_retries + 1):
+            await bucket.acquire()
+            try:
+                with span("openai", "chat.completions.reason", attempt=attempt) as call:
+                    response = await client.chat.completions.create(
+                        model=model,
+                        messages=[{"role": "user", "content": prompt}]
+                    )
+                    call.usage(response)
+                return response.choices[0].message.content.strip()
+            except (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+                if attempt == max_retries:
+                    raise
+                delay = _retry_delay(e, attempt)
+                print(f"{type(e).__name__}, retrying in {delay:.2f}s (attempt {attempt + 1}/{max_retries})")
+                await asyncio.sleep(delay)
+
+
+async def generate_reasons(prompts, model="gpt-4o", max_in_flight=None, rate_per_sec=None,
+                           max_retries=None, client=None, fallbacks=None):
+    """
+    Runs one chat completion per prompt with bounded concurrency and a shared
+    token-bucket rate limit. Returns the replies in the same order as `prompts`.
+
+    A prompt that still fails after retries gets the matching entry from
+    `fallbacks` (or None) instead of aborting the whole batch.
+    """
+    if not prompts:
+        return []
+    max_in_flight = max_in_flight or MAX_IN_FLIGHT
+    rate_per_sec = rate_per_sec or RATE_PER_SEC
+    max_retries = MAX_RETRIES if max_retries is None else max_retries
+
+    owns_client = client is None
+    if owns_client:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            base_url=os.getenv("OPENAI_BASE_URL"),
+            max_retries=0
+        )
+
+    bucket = TokenBucket(rate_per_sec)
+    semaphore = asyncio.Semaphore(max_in_flight)
+    try:
+        results = await asyncio.gather(
+            *(_complete(client, bucket, semaphore, prompt, model, max_retries) for prompt in prompts),
+            return_exceptions=True
+        )
+    finally:
+        if owns_client:
+            await client.close()
+
+    reasons = []
+    for i, result in enumerate(results):
+        if isinstance(result, BaseException):
+            print(f"Reason generation failed: {result}")
+            result = fallbacks[i] if fallbacks else None
+        reasons.append(result)
+    return reasons
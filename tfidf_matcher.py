@@ -0,0 +1,154 @@
+import re
+import numpy as np
+from scipy import sparse
+
+NGRAM_RANGE = (3, 5)
+MAX_CHARS = 200
+CHUNK_SIZE = 10000
+DEFAULT_THRESHOLD = 0.1
+# similarity runs as a dense BLAS matmul while the n-gram x document matrix stays this small
+DENSE_MAX_ELEMENTS = 32 * 1024 * 1024
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+
+def normalize(text):
+    """Lowercased words separated (and wrapped) by single spaces, so n-grams see word edges."""
+    return " " + _NON_WORD.sub(" ", (text or "").lower()).strip() + " "
+
+
+class TfidfMatcher:
+    """
+    Character n-gram TF-IDF similarity between free text (customer blobs) and a
+    fixed set of documents (craft descriptions).
+
+    N-grams are read straight out of a padded byte matrix with NumPy, so a
+    chunk of texts is vectorized without a Python loop over characters. The
+    vocabulary and IDF weights come from the documents; customer n-grams the
+    documents never contain still count towards the customer's vector norm,
+    which keeps long unrelated text from scoring high on one shared n-gram.
+    Scores are cosine similarities in [0, 1].
+    """
+
+    def __init__(self, documents, ngram_range=NGRAM_RANGE, max_chars=MAX_CHARS):
+        self.ngram_range = ngram_range
+        self.max_chars = max_chars
+        self.size = len(documents)
+
+        rows, codes = self._ngrams(documents)
+        self.vocabulary = np.unique(codes)
+        counts = self._counts(rows, np.searchsorted(self.vocabulary, codes), self.size)
+        df = np.bincount(counts.indices, minlength=len(self.vocabulary))
+        self.idf = (np.log((1 + self.size) / (1 + df)) + 1).astype(np.float32)
+        # weight given to n-grams no document contains (df = 0)
+        self.unseen_idf = np.float32(np.log(1 + self.size) + 1)
+        self._documents_t = self._weigh(counts, np.zeros(self.size, dtype=np.float32)).T.tocsr()
+        self._documents_dense = None
+        if len(self.vocabulary) * self.size <= DENSE_MAX_ELEMENTS:
+            self._documents_dense = self._documents_t.toarray()
+
+    def _ngrams(self, texts):
+        """(row, code) for every n-gram in `texts`; a code packs the n-gram's bytes into one int64."""
+        docs = [normalize(text).encode("utf-8")[:self.max_chars] for text in texts]
+        width = max((len(doc) for doc in docs), default=0)
+        if not docs or width == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        buf = np.frombuffer(b"".join(doc.ljust(width, b"\0") for doc in docs), dtype=np.uint8)
+        buf = buf.reshape(len(docs), width).astype(np.int64)
+
+        all_rows, all_codes = [], []
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            if width < n:
+                break
+            span = width - n + 1
+            code = np.zeros((len(docs), span), dtype=np.int64)
+            valid = np.ones((len(docs), span), dtype=bool)
+            for k in range(n):
+                column = buf[:, k:k + span]
+                code = (code << 8) | column
+                valid &= column != 0
+            rows, cols = np.nonzero(valid)
+            all_rows.append(rows)
+            all_codes.append(code[rows, cols])
+        return np.concatenate(all_rows), np.concatenate(all_codes)
+
+    def _counts(self, rows, features, n_rows):
+        counts = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, features)),
+            shape=(n_rows, len(self.vocabulary))
+        )
+        counts.sum_duplicates()
+        return counts
+
+    def _weigh(self, counts, unseen_sq):
+        """Sublinear TF x IDF, L2-normalized with `unseen_sq` added to each row's squared norm."""
+        weights = counts.astype(np.float32)
+        weights.data = (1 + np.log(weights.data)) * self.idf[weights.indices]
+        norms = np.sqrt(np.asarray(weights.multiply(weights).sum(axis=1)).ravel() + unseen_sq)
+        norms[norms == 0] = 1
+        return sparse.diags(1 / norms).dot(weights).tocsr()
+
+    def transform(self, texts):
+        """L2-normalized TF-IDF rows for `texts` over the document vocabulary."""
+        rows, codes = self._ngrams(texts)
+        features = np.searchsorted(self.vocabulary, codes)
+        features[features == len(self.vocabulary)] = 0
+        seen = self.vocabulary[features] == codes if len(self.vocabulary) else np.zeros(len(codes), dtype=bool)
+        # unseen n-grams are rare to repeat within one text; each occurrence counts once
+        unseen_sq = np.bincount(rows[~seen], minlength=len(texts)).astype(np.float32) * self.unseen_idf ** 2
+        return self._weigh(self._counts(rows[seen], features[seen], len(texts)), unseen_sq)
+
+    def similarity(self, texts):
+        """Dense len(texts) x documents cosine similarity matrix."""
+        vectors = self.transform(texts)
+        if self._documents_dense is None:
+            return (vectors @ self._documents_t).toarray()
+        # common n-grams are shared by most documents, so the product is dense anyway
+        scores = np.empty((len(texts), self.size), dtype=np.float32)
+        block = max(1, DENSE_MAX_ELEMENTS // max(1, len(self.vocabulary)))
+        for start in range(0, len(texts), block):
+            scores[start:start + block] = vectors[start:start + block].toarray() @ self._documents_dense
+        return scores
+
+    def iter_top_k(self, texts, k=3, threshold=DEFAULT_THRESHOLD, chunk_size=CHUNK_SIZE):
+        """
+        Scores `texts` (any iterable) in chunks of `chunk_size` and yields one
+        (indices, scores) pair of (chunk_len, k) arrays per chunk. Each row holds
+        the best documents by descending score; slots below `threshold` are -1 / 0.
+        """
+        k = min(k, self.size)
+        chunk = []
+        for text in texts:
+            chunk.append(text)
+            if len(chunk) == chunk_size:
+                yield self._top_k(chunk, k, threshold)
+                chunk = []
+        if chunk:
+            yield self._top_k(chunk, k, threshold)
+
+    def _top_k(self, texts, k, threshold):
+        scores = self.similarity(texts)
+        if k == 0:
+            empty = np.empty((len(texts), 0))
+            return empty.astype(np.int64), empty.astype(np.float32)
+        if k < self.size:
+            indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            indices = np.tile(np.arange(self.size), (len(texts), 1))
+        top = np.take_along_axis(scores, indices, axis=1)
+        # best first; ties go to the lower document index
+        order = np.lexsort((indices, -top), axis=1)
+        indices = np.take_along_axis(indices, order, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        below = top < threshold
+        indices[below] = -1
+        top[below] = 0
+        return indices, top
+
+    def top_k(self, texts, k=3, threshold=DEFAULT_THRESHOLD, chunk_size=CHUNK_SIZE):
+        """[(document_index, score), ...] per text, best first, scores >= threshold."""
+        results = []
+        for indices, scores in self.iter_top_k(texts, k, threshold, chunk_size):
+            for row_indices, row_scores in zip(indices.tolist(), scores.tolist()):
+                results.append([(i, s) for i, s in zip(row_indices, row_scores) if i >= 0])
+        return results
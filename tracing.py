@@ -0,0 +1,247 @@
+"""
+Timed spans for finding where an agent turn spends its time.
+
+With TRACE=1 (or "Record traces" ticked in the Diagnostics tab) every agent
+tool, SQLite statement, OpenAI call, customer scan chunk and image decode is
+timed and appended to TRACE_FILE as one JSON object per line:
+
+    {"ts": 1718000000.0, "trace": "9f1c...", "span": "04ab...", "parent": "9f1c...",
+     "kind": "openai", "name": "chat.completions", "ms": 412.7, "error": null,
+     "model": "gpt-4o", "input_tokens": 310, "output_tokens": 54, "cost_usd": 0.001315}
+
+A span opened while another is active in the same thread or task gets its
+trace id and is recorded as its child, so one tool call groups its queries and
+completions. Token counts come from the responses' usage and cost from
+MODEL_PRICES. When tracing is off, span() returns a shared no-op and @traced
+functions cost one flag check.
+"""
+import os
+import json
+import time
+import inspect
+import threading
+import functools
+import contextvars
+from collections import deque
+
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+SQL_PREVIEW = 200
+# USD per million (input, output) tokens; the longest matching prefix of the model name wins
+MODEL_PRICES = {
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4o-mini": (0.15, 0.60),
+}
+
+enabled = os.getenv("TRACE", "0") == "1"
+
+_current = contextvars.ContextVar("tracing_span", default=None)
+_file = None
+_file_pid = None
+_file_lock = threading.Lock()
+
+
+def set_enabled(on):
+    """Turns tracing on or off for this process and for worker processes started after it."""
+    global enabled
+    enabled = bool(on)
+    os.environ["TRACE"] = "1" if enabled else "0"
+
+
+def cost(model, input_tokens, output_tokens):
+    """USD cost of one call, or None for a model missing from MODEL_PRICES."""
+    matches = [prefix for prefix in MODEL_PRICES if model and model.startswith(prefix)]
+    if not matches:
+        return None
+    input_price, output_price = MODEL_PRICES[max(matches, key=len)]
+    return round((input_tokens * input_price + output_tokens * output_price) / 1_000_000, 6)
+
+
+def write(record):
+    """Appends one record to TRACE_FILE; lines from several processes interleave whole."""
+    global _file, _file_pid
+    line = json.dumps(record, default=str) + "\n"
+    with _file_lock:
+        # a forked worker must not share the parent's buffer
+        if _file is None or _file_pid != os.getpid():
+            _file = open(TRACE_FILE, "a", encoding="utf-8")
+            _file_pid = os.getpid()
+        _file.write(line)
+        _file.flush()
+
+
+def record(kind, name, ms, start=None, error=None, **attrs):
+    """Writes a span timed elsewhere (e.g. by the agents SDK) as a child of the current span."""
+    if not enabled:
+        return
+    parent = _current.get()
+    span_id = os.urandom(8).hex()
+    entry = {"ts": start if start is not None else time.time() - ms / 1000,
+              "trace": parent.trace if parent is not None else span_id, "span": span_id,
+              "parent": parent.id if parent is not None else None,
+              "kind": kind, "name": name, "ms": round(ms, 3), "error": error}
+    entry.update(attrs)
+    write(entry)
+
+
+class Span:
+    __slots__ = ("kind", "name", "attrs", "id", "trace", "parent", "start", "_started", "_token")
+
+    def __init__(self, kind, name, attrs):
+        self.kind = kind
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def usage(self, response, model=None):
+        """Adds model, token counts and cost from a chat completions or responses `usage`."""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        input_tokens = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", 0) or 0
+        output_tokens = getattr(usage, "completion_tokens", None) or getattr(usage, "output_tokens", 0) or 0
+        self.tokens(model or getattr(response, "model", None), input_tokens, output_tokens)
+
+    def tokens(self, model, input_tokens, output_tokens):
+        self.attrs.update(model=model, input_tokens=input_tokens, output_tokens=output_tokens,
+                          cost_usd=cost(model, input_tokens, output_tokens))
+
+    def __enter__(self):
+        parent = _current.get()
+        self.id = os.urandom(8).hex()
+        self.trace = parent.trace if parent is not None else self.id
+        self.parent = parent.id if parent is not None else None
+        self._token = _current.set(self)
+        self.start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        ms = (time.perf_counter() - self._started) * 1000
+        try:
+            _current.reset(self._token)
+        except ValueError:
+            # exited from another context, e.g. an async generator closed elsewhere
+            pass
+        record = {"ts": self.start, "trace": self.trace, "span": self.id, "parent": self.parent,
+                  "kind": self.kind, "name": self.name, "ms": round(ms, 3),
+                  "error": f"{exc_type.__name__}: {exc}" if exc_type is not None else None}
+        record.update(self.attrs)
+        write(record)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def usage(self, response, model=None):
+        pass
+
+    def tokens(self, model, input_tokens, output_tokens):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+def span(kind, name, **attrs):
+    """Context manager timing its block as one record; the shared NO_SPAN while tracing is off."""
+    if not enabled:
+        return NO_SPAN
+    return Span(kind, name, attrs)
+
+
+def traced(kind, name=None):
+    """Decorator recording each call of a sync or async function as a span named after it."""
+    def decorator(fn):
+        label = name or fn.__name__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                if not enabled:
+                    return await fn(*args, **kwargs)
+                with Span(kind, label, {}):
+                    return await fn(*args, **kwargs)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not enabled:
+                    return fn(*args, **kwargs)
+                with Span(kind, label, {}):
+                    return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def sql_preview(sql):
+    return " ".join(sql.split())[:SQL_PREVIEW]
+
+
+def read_spans(limit=5000, path=None):
+    """The last `limit` records of the trace file, oldest first."""
+    path = path or TRACE_FILE
+    if not os.path.exists(path):
+        return []
+    records = deque(maxlen=limit)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                # a line still being written by another process
+                continue
+    return list(records)
+
+
+def _percentile(values, q):
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def summarize(records, by="name"):
+    """
+    One row per kind and `by` field (e.g. "sql" for db spans): count, errors,
+    total/p50/p95/max ms, tokens and cost; largest total time first.
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault((record.get("kind"), record.get(by)), []).append(record)
+    rows = []
+    for (kind, name), group in groups.items():
+        durations = sorted(record["ms"] for record in group)
+        costs = [record["cost_usd"] for record in group if record.get("cost_usd") is not None]
+        rows.append({
+            "kind": kind,
+            by: name,
+            "count": len(group),
+            "errors": sum(1 for record in group if record.get("error")),
+            "total_ms": round(sum(durations), 1),
+            "p50_ms": round(_percentile(durations, 50), 1),
+            "p95_ms": round(_percentile(durations, 95), 1),
+            "max_ms": round(durations[-1], 1),
+            "input_tokens": sum(record.get("input_tokens") or 0 for record in group),
+            "output_tokens": sum(record.get("output_tokens") or 0 for record in group),
+            "cost_usd": round(sum(costs), 6) if costs else None,
+        })
+    rows.sort(key=lambda row: row["total_ms"], reverse=True)
+    return rows
+
+
+def clear():
+    """Empties the trace file."""
+    global _file
+    with _file_lock:
+        if _file is not None:
+            _file.close()
+            _file = None
+        open(TRACE_FILE, "w").close()
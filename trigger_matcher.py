@@ -0,0 +1,67 @@
+from collections import deque
+
+
+class TriggerMatcher:
+    """
+    Aho-Corasick automaton over a set of craft triggers.
+
+    Built once per refresh; `match` scans a lowercased customer text blob in a
+    single pass and returns the triggers it contains, in the same order as
+    `[t for t in triggers if t.lower() in text_blob]` would.
+    """
+
+    def __init__(self, triggers):
+        self.triggers = list(triggers)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        self._always = []
+
+        for index, trigger in enumerate(self.triggers):
+            pattern = trigger.lower()
+            if not pattern:
+                # "" is a substring of every blob
+                self._always.append(index)
+                continue
+            state = 0
+            for ch in pattern:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                    self._goto[state][ch] = nxt
+                state = nxt
+            self._out[state] += (index,)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._out[nxt] += self._out[self._fail[nxt]]
+
+    def __len__(self):
+        return len(self.triggers)
+
+    def match_indices(self, text_blob):
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        hits = set(self._always)
+        for ch in text_blob:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                hits.update(out[state])
+        return sorted(hits)
+
+    def match(self, text_blob):
+        triggers = self.triggers
+        return [triggers[i] for i in self.match_indices(text_blob)]